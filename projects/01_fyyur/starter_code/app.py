@@ -3,15 +3,24 @@
 #----------------------------------------------------------------------------#
 
 import json
+import math
+import functools
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, session
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime
+from urllib.parse import urlencode
+from sqlalchemy import and_, or_, case, event, func, inspect
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from areas import AreaSummary, ShowCounts
+from search import NameIndex, PrefixCache, like_pattern
+from cache import PageCache
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -57,17 +66,309 @@ class Artist(db.Model):
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 
+class Show(db.Model):
+    __tablename__ = 'Show'
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+
+    # the venue and artist pages read a range of one venue's / artist's shows by time
+    __table_args__ = (
+        db.Index('ix_show_venue_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_start_time', 'artist_id', 'start_time'),
+    )
+
+#----------------------------------------------------------------------------#
+# Show listings.
+#----------------------------------------------------------------------------#
+
+SHOWS_PER_PAGE = 12
+
+def get_page(name):
+  return max(request.args.get(name, 1, type=int) or 1, 1)
+
+def parse_cursor(value):
+  # "<start time>,<show id>" of the last show on the previous page, or None
+  try:
+    start_time, show_id = value.rsplit(',', 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+  except (AttributeError, ValueError):
+    return None
+
+def show_count_loader(column, owner_id):
+  def load(now):
+    total = db.session.query(func.count(Show.id)).filter(column == owner_id).scalar()
+    upcoming = db.session.query(Show.start_time).filter(column == owner_id, Show.start_time > now)
+    return total, [start_time for start_time, in upcoming]
+  return load
+
+def show_listing(column, owner_id, other, other_column, prefix, counts):
+  # past and upcoming shows of one venue (or artist), a page of each plus both
+  # counts. The counts come from `counts` (ShowCounts), the pages from LIMIT
+  # range queries over the (owner, start_time) index: upcoming shows by page
+  # number, past shows by keyset (?past_before=<start time>,<id>), so the page
+  # costs the same however many shows the owner has had.
+  now = datetime.now()
+  upcoming_count, past_count, next_show_time = counts.counts(owner_id, show_count_loader(column, owner_id))
+  listing = {
+    'past_shows_count': past_count,
+    'upcoming_shows_count': upcoming_count,
+    # the split above changes when this show starts
+    'next_show_time': next_show_time,
+  }
+  query = db.session.query(other.id, other.name, other.image_link, Show.start_time, Show.id) \
+    .join(other, other.id == other_column).filter(column == owner_id)
+
+  pages = math.ceil(upcoming_count / SHOWS_PER_PAGE)
+  page = min(get_page('upcoming_page'), max(pages, 1))
+  upcoming = []
+  if upcoming_count:
+    upcoming = query.filter(Show.start_time > now).order_by(Show.start_time, Show.id) \
+      .offset((page - 1) * SHOWS_PER_PAGE).limit(SHOWS_PER_PAGE).all()
+  listing['upcoming_page'] = page
+  listing['upcoming_pages'] = pages
+
+  cursor = parse_cursor(request.args.get('past_before'))
+  past = []
+  if past_count:
+    # a single upper bound for the index range, the OR only breaks ties on id
+    past_query = query.filter(Show.start_time <= (min(now, cursor[0]) if cursor else now))
+    if cursor is not None:
+      past_query = past_query.filter(or_(Show.start_time < cursor[0],
+        and_(Show.start_time == cursor[0], Show.id < cursor[1])))
+    past = past_query.order_by(Show.start_time.desc(), Show.id.desc()).limit(SHOWS_PER_PAGE + 1).all()
+  listing['past_before'] = request.args.get('past_before') if cursor is not None else None
+  listing['past_next'] = None
+  if len(past) > SHOWS_PER_PAGE:
+    past = past[:SHOWS_PER_PAGE]
+    listing['past_next'] = '{},{}'.format(past[-1].start_time.isoformat(), past[-1].id)
+  # query strings that keep one side's position while paging the other
+  listing['keep_past'] = urlencode({'past_before': listing['past_before']}) if cursor is not None else ''
+  listing['keep_upcoming'] = 'upcoming_page={}'.format(page) if page > 1 else ''
+
+  for side, rows in (('upcoming', upcoming), ('past', past)):
+    listing[side + '_shows'] = [{
+      prefix + '_id': other_id,
+      prefix + '_name': name,
+      prefix + '_image_link': image_link,
+      'start_time': start_time,
+    } for other_id, name, image_link, start_time, show_id in rows]
+  return listing
+
+#----------------------------------------------------------------------------#
+# Summaries.
+#----------------------------------------------------------------------------#
+
+# the /venues listing, kept up to date from committed Venue and Show changes
+area_summary = AreaSummary()
+# name search on databases without pg_trgm, and search box suggestions
+venue_names = NameIndex(max_age=300)
+artist_names = NameIndex(max_age=300)
+autocomplete_cache = PrefixCache()
+# rendered pages, stamped with the versions of the venues, artists and shows they show
+PAGE_CACHE_MAX_AGE = 300
+page_cache = PageCache(max_age=PAGE_CACHE_MAX_AGE)
+# past / upcoming counts of the venue and artist pages
+SHOW_COUNTS_MAX_AGE = 300
+venue_show_counts = ShowCounts(max_age=SHOW_COUNTS_MAX_AGE)
+artist_show_counts = ShowCounts(max_age=SHOW_COUNTS_MAX_AGE)
+
+def venue_area_rows(now):
+  # one grouped query for every venue: its upcoming show count and the next show,
+  # which is when that count goes stale
+  upcoming = and_(Show.venue_id == Venue.id, Show.start_time > now)
+  return db.session.query(
+    Venue.id, Venue.name, Venue.city, Venue.state,
+    func.count(Show.id), func.min(Show.start_time)
+  ).outerjoin(Show, upcoming).group_by(Venue.id).all()
+
+def changed_ids(obj, name):
+  # current and, if the flush changed it, previous value of a foreign key
+  ids = {getattr(obj, name)}
+  ids.update(inspect(obj).attrs[name].history.deleted or ())
+  return ids
+
+def show_tags(show):
+  tags = {'venues', 'shows'}
+  tags.update(('venue', venue_id) for venue_id in changed_ids(show, 'venue_id'))
+  tags.update(('artist', artist_id) for artist_id in changed_ids(show, 'artist_id'))
+  return tags
+
+def show_count_changes(show):
+  # a changed or deleted show drops the counts of every venue and artist it was at
+  changes = [(venue_show_counts.invalidate, (venue_id,)) for venue_id in changed_ids(show, 'venue_id')]
+  changes.extend((artist_show_counts.invalidate, (artist_id,)) for artist_id in changed_ids(show, 'artist_id'))
+  return changes
+
+@event.listens_for(db.session, 'after_flush')
+def collect_changes(session, flush_context):
+  # values are read here, after_commit can no longer touch the rows
+  changes = session.info.setdefault('summary_changes', [])
+  tags = set()
+  for obj in session.new.union(session.dirty):
+    if isinstance(obj, Venue):
+      changes.append((area_summary.venue_changed, (obj.id, obj.name, obj.city, obj.state)))
+      changes.append((venue_names.add, (obj.id, obj.name)))
+      tags.update((('venue', obj.id), 'venues', 'shows'))
+    elif isinstance(obj, Artist):
+      changes.append((artist_names.add, (obj.id, obj.name)))
+      tags.update((('artist', obj.id), 'artists', 'shows'))
+    elif isinstance(obj, Show):
+      if obj in session.new:
+        changes.append((area_summary.show_added, (obj.venue_id, obj.start_time)))
+        changes.append((venue_show_counts.show_added, (obj.venue_id, obj.start_time)))
+        changes.append((artist_show_counts.show_added, (obj.artist_id, obj.start_time)))
+      else:
+        changes.append((area_summary.invalidate, ()))
+        changes.extend(show_count_changes(obj))
+      tags.update(show_tags(obj))
+  for obj in session.deleted:
+    if isinstance(obj, Venue):
+      changes.append((area_summary.venue_deleted, (obj.id,)))
+      changes.append((venue_names.remove, (obj.id,)))
+      changes.append((venue_show_counts.invalidate, (obj.id,)))
+      tags.update((('venue', obj.id), 'venues', 'shows'))
+    elif isinstance(obj, Artist):
+      changes.append((artist_names.remove, (obj.id,)))
+      changes.append((artist_show_counts.invalidate, (obj.id,)))
+      tags.update((('artist', obj.id), 'artists', 'shows'))
+    elif isinstance(obj, Show):
+      changes.append((area_summary.invalidate, ()))
+      changes.extend(show_count_changes(obj))
+      tags.update(show_tags(obj))
+  if tags.intersection(('venues', 'artists')):
+    changes.append((autocomplete_cache.clear, ()))
+  if tags:
+    changes.append((page_cache.bump, tuple(tags)))
+
+def stage_change(apply, *args):
+  # for writes collect_changes cannot see, such as bulk deletes; applied on commit
+  db.session.info.setdefault('summary_changes', []).append((apply, args))
+
+@event.listens_for(db.session, 'after_commit')
+def apply_changes(session):
+  for apply, args in session.info.pop('summary_changes', []):
+    apply(*args)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_changes(session):
+  session.info.pop('summary_changes', None)
+
+def cached_page(key, render):
+  # render() returns (html, tags of the entities on the page, datetime it expires
+  # at or None). Pages are neither cached nor served from the cache while flash
+  # messages are pending, those belong to this response only.
+  if '_flashes' in session:
+    return render()[0]
+  html = page_cache.get(key)
+  if html is None:
+    since = page_cache.clock
+    html, tags, expires_at = render()
+    page_cache.put(key, html, tags, since, expires_at)
+  return html
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+SEARCH_LIMIT = 100
+AUTOCOMPLETE_LIMIT = 8
+MAX_AUTOCOMPLETE_LIMIT = 20
+SEARCH_MODELS = {
+  'venues': (Venue, venue_names),
+  'artists': (Artist, artist_names),
+}
+
+def use_trigram_index():
+  return db.engine.dialect.name == 'postgresql'
+
+@app.before_first_request
+def create_search_indexes():
+  # pg_trgm GIN indexes turn name ILIKE '%term%' into an index lookup
+  if not use_trigram_index():
+    return
+  try:
+    db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+      db.session.execute('CREATE INDEX IF NOT EXISTS ix_{}_name_trgm ON "{}" USING gin (name gin_trgm_ops)'.format(table.lower(), table))
+    db.session.commit()
+  except Exception as err:
+    # searching still works, as a scan
+    db.session.rollback()
+    app.logger.warning('could not create the trigram search indexes: %s', err)
+
+def search_names(kind, term, limit=SEARCH_LIMIT):
+  # [(id, name)] of the venues / artists whose name contains term, ordered by
+  # name, and the total number of matches
+  model, index = SEARCH_MODELS[kind]
+  if use_trigram_index():
+    rows = db.session.query(model.id, model.name, func.count().over()) \
+      .filter(model.name.ilike(like_pattern(term), escape='\\')) \
+      .order_by(func.lower(model.name), model.id).limit(limit).all()
+    return [(row[0], row[1]) for row in rows], (rows[0][2] if rows else 0)
+  index.ensure_loaded(lambda: db.session.query(model.id, model.name).all())
+  return index.search(term, limit)
+
+def complete_names(kind, term, limit):
+  # up to limit [(id, name)], names starting with term before names containing it
+  model, index = SEARCH_MODELS[kind]
+  if use_trigram_index():
+    starts_with = model.name.ilike(like_pattern(term, prefix_only=True), escape='\\')
+    rows = db.session.query(model.id, model.name) \
+      .filter(model.name.ilike(like_pattern(term), escape='\\')) \
+      .order_by(case([(starts_with, 0)], else_=1), func.lower(model.name), model.id) \
+      .limit(limit).all()
+    return [(row[0], row[1]) for row in rows]
+  index.ensure_loaded(lambda: db.session.query(model.id, model.name).all())
+  return index.complete(term, limit)
+
+def upcoming_counts(column, ids):
+  # {id: upcoming shows} for a page of search results, one grouped query
+  if not ids:
+    return {}
+  return dict(db.session.query(column, func.count(Show.id))
+    .filter(column.in_(ids), Show.start_time > datetime.now())
+    .group_by(column).all())
+
+#----------------------------------------------------------------------------#
+# Form data.
+#----------------------------------------------------------------------------#
+
+VENUE_FIELDS = ('name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link')
+ARTIST_FIELDS = ('name', 'city', 'state', 'phone', 'image_link', 'facebook_link')
+
+def fill_from_form(obj, fields):
+  for field in fields:
+    setattr(obj, field, request.form.get(field))
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+# parsed once instead of on every call
+DATETIME_PATTERNS = {name: babel.dates.parse_pattern(pattern) for name, pattern in DATETIME_FORMATS.items()}
+DATETIME_LOCALE = babel.Locale.parse(babel.dates.LC_TIME)
+DATETIME_MEMO_SIZE = 16384
+
+@functools.lru_cache(maxsize=DATETIME_MEMO_SIZE)
+def format_datetime_value(value, format):
+  # datetimes from the database are used as they are, only strings are parsed
+  date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
+  pattern = DATETIME_PATTERNS.get(format)
+  if pattern is None:
+    return babel.dates.format_datetime(date, format)
+  return pattern.apply(date, DATETIME_LOCALE)
+
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+  # show pages repeat the same start times on every render, so results are
+  # memoized per (value, format) in a bounded LRU
+  return format_datetime_value(value, format)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -85,129 +386,53 @@ def index():
 
 @app.route('/venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "city": "San Francisco",
-    "state": "CA",
-    "venues": [{
-      "id": 1,
-      "name": "The Musical Hop",
-      "num_upcoming_shows": 0,
-    }, {
-      "id": 3,
-      "name": "Park Square Live Music & Coffee",
-      "num_upcoming_shows": 1,
-    }]
-  }, {
-    "city": "New York",
-    "state": "NY",
-    "venues": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }]
-  return render_template('pages/venues.html', areas=data);
+  # venues grouped by area, with num_upcoming_shows per venue. Served from
+  # area_summary, which is (re)built from a single grouped query when stale.
+  def render():
+    area_summary.ensure_loaded(venue_area_rows)
+    html = render_template('pages/venues.html', areas=area_summary.areas())
+    return html, ['venues'], area_summary.valid_until
+  return cached_page(('venues',), render)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  # partial, case-insensitive search on venue names.
   # seach for Hop should return "The Musical Hop".
   # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+  search_term = request.form.get('search_term', '')
+  matches, count = search_names('venues', search_term)
+  upcoming = upcoming_counts(Show.venue_id, [venue_id for venue_id, name in matches])
   response={
-    "count": 1,
+    "count": count,
     "data": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
+      "id": venue_id,
+      "name": name,
+      "num_upcoming_shows": upcoming.get(venue_id, 0),
+    } for venue_id, name in matches]
   }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    "past_shows": [{
-      "artist_id": 4,
-      "artist_name": "Guns N Petals",
-      "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 2,
-    "name": "The Dueling Pianos Bar",
-    "genres": ["Classical", "R&B", "Hip-Hop"],
-    "address": "335 Delancey Street",
-    "city": "New York",
-    "state": "NY",
-    "phone": "914-003-1132",
-    "website": "https://www.theduelingpianos.com",
-    "facebook_link": "https://www.facebook.com/theduelingpianos",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1497032205916-ac775f0649ae?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=750&q=80",
-    "past_shows": [],
-    "upcoming_shows": [],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 3,
-    "name": "Park Square Live Music & Coffee",
-    "genres": ["Rock n Roll", "Jazz", "Classical", "Folk"],
-    "address": "34 Whiskey Moore Ave",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "415-000-1234",
-    "website": "https://www.parksquarelivemusicandcoffee.com",
-    "facebook_link": "https://www.facebook.com/ParkSquareLiveMusicAndCoffee",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-    "past_shows": [{
-      "artist_id": 5,
-      "artist_name": "Matt Quevedo",
-      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [{
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 1,
-  }
-  data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
-  return render_template('pages/show_venue.html', venue=data)
+  def render():
+    venue = Venue.query.get_or_404(venue_id)
+    data = {
+      "id": venue.id,
+      "name": venue.name,
+      "address": venue.address,
+      "city": venue.city,
+      "state": venue.state,
+      "phone": venue.phone,
+      "facebook_link": venue.facebook_link,
+      "image_link": venue.image_link,
+    }
+    data.update(show_listing(Show.venue_id, venue_id, Artist, Show.artist_id, 'artist', venue_show_counts))
+    tags = [('venue', venue_id)]
+    tags.extend(('artist', show['artist_id']) for show in data['upcoming_shows'] + data['past_shows'])
+    html = render_template('pages/show_venue.html', venue=data)
+    return html, tags, data['next_show_time']
+  return cached_page(('venue', venue_id, get_page('upcoming_page'), request.args.get('past_before')), render)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -219,134 +444,110 @@ def create_venue_form():
 
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  venue = Venue()
+  fill_from_form(venue, VENUE_FIELDS)
+  try:
+    db.session.add(venue)
+    db.session.commit()
+    # on successful db insert, flash success
+    flash('Venue ' + request.form['name'] + ' was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not list venue')
+    flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
   return render_template('pages/home.html')
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+  venue = Venue.query.get_or_404(venue_id)
+  try:
+    # not left to ON DELETE CASCADE, SQLite does not enforce foreign keys. The
+    # bulk delete skips the flush hooks, so the pages of every artist who played
+    # here are invalidated explicitly.
+    shows = Show.query.filter(Show.venue_id == venue.id)
+    artist_ids = [artist_id for artist_id, in shows.with_entities(Show.artist_id).distinct()]
+    stage_change(page_cache.bump, *(('artist', artist_id) for artist_id in artist_ids))
+    for artist_id in artist_ids:
+      stage_change(artist_show_counts.invalidate, artist_id)
+    shows.delete(synchronize_session=False)
+    db.session.delete(venue)
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not delete venue %s', venue_id)
+    abort(500)
+  return jsonify({'success': True})
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data=[{
-    "id": 4,
-    "name": "Guns N Petals",
-  }, {
-    "id": 5,
-    "name": "Matt Quevedo",
-  }, {
-    "id": 6,
-    "name": "The Wild Sax Band",
-  }]
-  return render_template('pages/artists.html', artists=data)
+  def render():
+    data = [{
+      "id": artist_id,
+      "name": name,
+    } for artist_id, name in db.session.query(Artist.id, Artist.name).order_by(Artist.name, Artist.id)]
+    return render_template('pages/artists.html', artists=data), ['artists'], None
+  return cached_page(('artists',), render)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+  # partial, case-insensitive search on artist names.
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
+  search_term = request.form.get('search_term', '')
+  matches, count = search_names('artists', search_term)
+  upcoming = upcoming_counts(Show.artist_id, [artist_id for artist_id, name in matches])
   response={
-    "count": 1,
+    "count": count,
     "data": [{
-      "id": 4,
-      "name": "Guns N Petals",
-      "num_upcoming_shows": 0,
-    }]
+      "id": artist_id,
+      "name": name,
+      "num_upcoming_shows": upcoming.get(artist_id, 0),
+    } for artist_id, name in matches]
   }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@app.route('/search/autocomplete')
+def autocomplete():
+  # search box suggestions as JSON: ?q=<typed text>&type=venues|artists&limit=<n>,
+  # both types when type is omitted. Results are cached per typed prefix.
+  term = request.args.get('q', '').strip()
+  kind = request.args.get('type')
+  if kind is not None and kind not in SEARCH_MODELS:
+    abort(400)
+  limit = request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int) or AUTOCOMPLETE_LIMIT
+  limit = min(max(limit, 1), MAX_AUTOCOMPLETE_LIMIT)
+  results = {}
+  for kind in ([kind] if kind else SEARCH_MODELS):
+    names = []
+    if term:
+      names = autocomplete_cache.get((kind, term.lower(), limit),
+        lambda: complete_names(kind, term, limit))
+    results[kind] = [{"id": name_id, "name": name} for name_id, name in names]
+  return jsonify(results)
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "past_shows": [{
-      "venue_id": 1,
-      "venue_name": "The Musical Hop",
-      "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 5,
-    "name": "Matt Quevedo",
-    "genres": ["Jazz"],
-    "city": "New York",
-    "state": "NY",
-    "phone": "300-400-5000",
-    "facebook_link": "https://www.facebook.com/mattquevedo923251523",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "past_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 6,
-    "name": "The Wild Sax Band",
-    "genres": ["Jazz", "Classical"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "432-325-5432",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "past_shows": [],
-    "upcoming_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 3,
-  }
-  data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
-  return render_template('pages/show_artist.html', artist=data)
+  # shows the artist page with the given artist_id
+  def render():
+    artist = Artist.query.get_or_404(artist_id)
+    data = {
+      "id": artist.id,
+      "name": artist.name,
+      "genres": artist.genres.split(',') if artist.genres else [],
+      "city": artist.city,
+      "state": artist.state,
+      "phone": artist.phone,
+      "facebook_link": artist.facebook_link,
+      "image_link": artist.image_link,
+    }
+    data.update(show_listing(Show.artist_id, artist_id, Venue, Show.venue_id, 'venue', artist_show_counts))
+    tags = [('artist', artist_id)]
+    tags.extend(('venue', show['venue_id']) for show in data['upcoming_shows'] + data['past_shows'])
+    html = render_template('pages/show_artist.html', artist=data)
+    return html, tags, data['next_show_time']
+  return cached_page(('artist', artist_id, get_page('upcoming_page'), request.args.get('past_before')), render)
 
 #  Update
 #  ----------------------------------------------------------------
@@ -371,9 +572,15 @@ def edit_artist(artist_id):
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-
+  artist = Artist.query.get_or_404(artist_id)
+  fill_from_form(artist, ARTIST_FIELDS)
+  artist.genres = ','.join(request.form.getlist('genres'))
+  try:
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not update artist %s', artist_id)
+    flash('An error occurred. Artist ' + request.form.get('name', '') + ' could not be updated.')
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
@@ -398,8 +605,14 @@ def edit_venue(venue_id):
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
+  venue = Venue.query.get_or_404(venue_id)
+  fill_from_form(venue, VENUE_FIELDS)
+  try:
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not update venue %s', venue_id)
+    flash('An error occurred. Venue ' + request.form.get('name', '') + ' could not be updated.')
   return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
@@ -413,13 +626,18 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
+  artist = Artist()
+  fill_from_form(artist, ARTIST_FIELDS)
+  artist.genres = ','.join(request.form.getlist('genres'))
+  try:
+    db.session.add(artist)
+    db.session.commit()
+    # on successful db insert, flash success
+    flash('Artist ' + request.form['name'] + ' was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not list artist')
+    flash('An error occurred. Artist ' + request.form['name'] + ' could not be listed.')
   return render_template('pages/home.html')
 
 
@@ -429,45 +647,21 @@ def create_artist_submission():
 @app.route('/shows')
 def shows():
   # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "venue_id": 1,
-    "venue_name": "The Musical Hop",
-    "artist_id": 4,
-    "artist_name": "Guns N Petals",
-    "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "start_time": "2019-05-21T21:30:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 5,
-    "artist_name": "Matt Quevedo",
-    "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "start_time": "2019-06-15T23:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-01T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-08T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-15T20:00:00.000Z"
-  }]
-  return render_template('pages/shows.html', shows=data)
+  def render():
+    rows = db.session.query(
+      Show.venue_id, Venue.name, Show.artist_id, Artist.name, Artist.image_link, Show.start_time
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id) \
+      .order_by(Show.start_time, Show.id)
+    data = [{
+      "venue_id": venue_id,
+      "venue_name": venue_name,
+      "artist_id": artist_id,
+      "artist_name": artist_name,
+      "artist_image_link": artist_image_link,
+      "start_time": start_time,
+    } for venue_id, venue_name, artist_id, artist_name, artist_image_link, start_time in rows]
+    return render_template('pages/shows.html', shows=data), ['shows'], None
+  return cached_page(('shows',), render)
 
 @app.route('/shows/create')
 def create_shows():
@@ -478,13 +672,20 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
-
-  # on successful db insert, flash success
-  flash('Show was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  try:
+    show = Show(
+      artist_id=int(request.form['artist_id']),
+      venue_id=int(request.form['venue_id']),
+      start_time=dateutil.parser.parse(request.form['start_time'])
+    )
+    db.session.add(show)
+    db.session.commit()
+    # on successful db insert, flash success
+    flash('Show was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not list show')
+    flash('An error occurred. Show could not be listed.')
   return render_template('pages/home.html')
 
 @app.errorhandler(404)
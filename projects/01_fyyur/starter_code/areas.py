@@ -0,0 +1,181 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from reloadable import Reloadable
+
+
+'''
+AreaSummary
+    materialized copy of the /venues listing. load() takes one row per venue,
+    (id, name, city, state, num_upcoming_shows, next_show), as returned by a
+    single grouped query, and areas() serves the grouped listing from memory.
+    Writes are applied incrementally; the summary only goes back to the
+    database when its next upcoming show has started (that show is now past,
+    so a count is stale), when `max_age` seconds have passed, or after
+    invalidate().
+'''
+class AreaSummary(Reloadable):
+    def __init__(self, max_age=None):
+        Reloadable.__init__(self, max_age, threading.RLock())
+        self.lock = self._lock
+        self._venues = {}
+        self._valid_until = None
+        self._areas = None
+
+    def __len__(self):
+        return len(self._venues)
+
+    @property
+    def loaded(self):
+        if not super().loaded:
+            return False
+        return self._valid_until is None or self._valid_until > datetime.now()
+
+    @property
+    def valid_until(self):
+        return self._valid_until
+
+    def load(self, rows):
+        with self.lock:
+            self._venues = {}
+            self._valid_until = None
+            for venue_id, name, city, state, upcoming, next_show in rows:
+                self._venues[venue_id] = [city, state, name, upcoming or 0]
+                self._expire_at(next_show)
+            self._areas = None
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self, loader):
+        '''
+        ensure_loaded(loader)
+            reloads from loader(now) when the summary is missing or stale
+        '''
+        with self.lock:
+            if not self.loaded:
+                self.load(loader(datetime.now()))
+
+    def _expire_at(self, start_time):
+        if start_time is not None and (self._valid_until is None or start_time < self._valid_until):
+            self._valid_until = start_time
+
+    def venue_changed(self, venue_id, name, city, state):
+        with self.lock:
+            if self._loaded_at is None:
+                return
+            venue = self._venues.get(venue_id)
+            if venue is None:
+                self._venues[venue_id] = [city, state, name, 0]
+            else:
+                venue[:3] = city, state, name
+            self._areas = None
+
+    def venue_deleted(self, venue_id):
+        with self.lock:
+            if self._venues.pop(venue_id, None) is not None:
+                self._areas = None
+
+    def show_added(self, venue_id, start_time):
+        with self.lock:
+            if self._loaded_at is None or start_time is None or start_time <= datetime.now():
+                return
+            venue = self._venues.get(venue_id)
+            if venue is None:
+                # a venue this summary has not seen yet, let the next load count it
+                self._loaded_at = None
+                return
+            venue[3] += 1
+            self._expire_at(start_time)
+            self._areas = None
+
+    def areas(self):
+        '''
+        areas()
+            [{city, state, venues: [{id, name, num_upcoming_shows}]}] ordered by
+            state, city and venue name
+        '''
+        with self.lock:
+            if self._areas is None:
+                grouped = {}
+                for venue_id, (city, state, name, upcoming) in self._venues.items():
+                    grouped.setdefault((state or '', city or ''), []).append({
+                        'id': venue_id,
+                        'name': name,
+                        'num_upcoming_shows': upcoming,
+                    })
+                self._areas = [{
+                    'city': city,
+                    'state': state,
+                    'venues': sorted(venues, key=lambda v: ((v['name'] or '').lower(), v['id'])),
+                } for (state, city), venues in sorted(grouped.items())]
+            return self._areas
+
+
+'''
+ShowCounts
+    past and upcoming show counts per venue (or artist), so a detail page does
+    not count all of an owner's shows on every render. An entry holds the
+    owner's total number of shows and the sorted start times of its upcoming
+    ones; a show whose start time has passed moves from upcoming to past
+    without a query. Entries are loaded on first use, kept current by
+    show_added() and dropped by invalidate(), after `max_age` seconds, or as
+    the least recently used beyond `max_entries`.
+'''
+class ShowCounts:
+    def __init__(self, max_entries=10000, max_age=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def counts(self, owner_id, loader):
+        '''
+        counts(owner_id, loader)
+            (upcoming, past, next show time) of an owner. A missing entry is
+            loaded from loader(now), which returns (total shows, upcoming start times).
+        '''
+        now = datetime.now()
+        with self._lock:
+            entry = self._entries.get(owner_id)
+            if entry is not None and self.max_age is not None and time.monotonic() - entry[0] > self.max_age:
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(owner_id)
+            generation = self._generation
+        if entry is None:
+            total, upcoming = loader(now)
+            entry = [time.monotonic(), total, sorted(upcoming)]
+            with self._lock:
+                # not kept if a show was written while loading, the next call reloads
+                if generation == self._generation:
+                    self._entries[owner_id] = entry
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        with self._lock:
+            times = entry[2]
+            del times[:bisect.bisect_right(times, now)]
+            return len(times), entry[1] - len(times), (times[0] if times else None)
+
+    def show_added(self, owner_id, start_time):
+        with self._lock:
+            self._generation += 1
+            entry = self._entries.get(owner_id)
+            if entry is None:
+                return
+            entry[1] += 1
+            if start_time > datetime.now():
+                bisect.insort(entry[2], start_time)
+
+    def invalidate(self, owner_id=None):
+        with self._lock:
+            self._generation += 1
+            if owner_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(owner_id, None)
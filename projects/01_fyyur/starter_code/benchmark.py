@@ -0,0 +1,131 @@
+'''
+benchmark.py
+    micro-benchmark for the datetime template filter.
+
+    Renders pages/shows.html with --shows shows through the real template and
+    layout, once per filter variant, and reports the median and p95 render
+    time in milliseconds as JSON:
+
+      naive         dateutil parse + babel format_datetime on every call (the
+                    original filter), start times as ISO strings
+      iso-cold      memoized filter, ISO strings, memo cleared before each render
+      iso-warm      memoized filter, ISO strings, memo kept between renders
+      datetime      memoized filter, datetimes as read from the database,
+                    memo cleared before each render
+
+    No database is needed.
+
+    python benchmark.py --shows 10000 --iterations 20
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as fyyur  # noqa: E402
+
+
+def naive_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def make_shows(count, distinct_times, rng):
+    '''
+    make_shows(count, distinct_times, rng)
+        show rows as shows() passes them to the template, start times drawn
+        from `distinct_times` evening slots
+    '''
+    start = datetime(2035, 1, 1, 20, 0)
+    times = [start + timedelta(days=i // 3, hours=i % 3) for i in range(distinct_times)]
+    return [{
+        'venue_id': rng.randint(1, 500),
+        'venue_name': 'Venue {}'.format(i % 500),
+        'artist_id': rng.randint(1, 2000),
+        'artist_name': 'Artist {}'.format(i % 2000),
+        'artist_image_link': 'https://example.com/artists/{}.jpg'.format(i % 2000),
+        'start_time': rng.choice(times),
+    } for i in range(count)]
+
+
+def render_times(shows, iterations, clear_memo):
+    timings = []
+    with fyyur.app.test_request_context('/shows'):
+        # compiles the template outside of the timings
+        render_template('pages/shows.html', shows=shows[:1])
+        for _ in range(iterations):
+            if clear_memo:
+                fyyur.format_datetime_value.cache_clear()
+            start = time.perf_counter()
+            render_template('pages/shows.html', shows=shows)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'median_ms': round(statistics.median(ordered), 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        'min_ms': round(ordered[0], 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark rendering pages/shows.html.')
+    parser.add_argument('--shows', type=int, default=10000, help='number of shows on the page')
+    parser.add_argument('--distinct-times', type=int, default=1000, help='number of different start times')
+    parser.add_argument('--iterations', type=int, default=20, help='renders per variant')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for the show rows')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    shows = make_shows(args.shows, args.distinct_times, rng)
+    iso_shows = [dict(show, start_time=show['start_time'].isoformat()) for show in shows]
+
+    filters = fyyur.app.jinja_env.filters
+    memoized = filters['datetime']
+    results = {}
+    try:
+        filters['datetime'] = naive_format_datetime
+        results['naive'] = summarize(render_times(iso_shows, args.iterations, False))
+    finally:
+        filters['datetime'] = memoized
+    results['iso-cold'] = summarize(render_times(iso_shows, args.iterations, True))
+    results['iso-warm'] = summarize(render_times(iso_shows, args.iterations, False))
+    results['datetime'] = summarize(render_times(shows, args.iterations, True))
+
+    report = {
+        'python': platform.python_version(),
+        'babel': babel.__version__ if hasattr(babel, '__version__') else None,
+        'shows': args.shows,
+        'distinct_times': args.distinct_times,
+        'iterations': args.iterations,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+'''
+PageCache
+    bounded LRU of rendered pages and fragments. Every entry is stamped with
+    the version of each entity it shows, given as tags such as ('venue', 3)
+    or 'shows', and is only served while all of them are unchanged. A write
+    calls bump() for the entities it touched, which makes every entry showing
+    them stale at once without walking the cache. Entries can also expire at
+    a given datetime (when an upcoming show becomes a past one) or after
+    `max_age` seconds (writes made by other processes). The cache holds at
+    most `max_entries` entries and `max_bytes` of text, evicting the least
+    recently used first.
+'''
+class PageCache:
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, max_age=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._clock = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def clock(self):
+        return self._clock
+
+    def bump(self, *tags):
+        with self._lock:
+            self._clock += 1
+            for tag in tags:
+                self._versions[tag] = self._clock
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stamps, stored_at, expires_at = entry
+                if (all(self._versions.get(tag, 0) == version for tag, version in stamps)
+                        and (self.max_age is None or time.monotonic() - stored_at <= self.max_age)
+                        and (expires_at is None or datetime.now() < expires_at)):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._discard(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, value, tags, since, expires_at=None):
+        '''
+        put(key, value, tags, since, expires_at)
+            stores a value rendered from data read after clock `since`. It is
+            not stored if one of its tags was bumped in the meantime, since the
+            value may predate that write.
+        '''
+        with self._lock:
+            stamps = tuple((tag, self._versions.get(tag, 0)) for tag in set(tags))
+            if any(version > since for tag, version in stamps):
+                return False
+            if len(value) > self.max_bytes:
+                return False
+            self._discard(key)
+            self._entries[key] = (value, stamps, time.monotonic(), expires_at)
+            self.size += len(value)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+            return True
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
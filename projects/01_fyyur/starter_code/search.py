@@ -0,0 +1,169 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+from reloadable import Reloadable
+
+GRAM = 3
+
+
+def fold(text):
+    return (text or '').lower()
+
+
+def grams(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def like_pattern(term, prefix_only=False):
+    '''
+    like_pattern(term, prefix_only)
+        ILIKE pattern matching `term` anywhere in the name (or at its start),
+        with LIKE wildcards in the term escaped by a backslash
+    '''
+    term = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return (term if prefix_only else '%' + term) + '%'
+
+
+'''
+NameIndex
+    in-process trigram index over venue or artist names, used when the
+    database has no pg_trgm (SQLite). Postings map every 3-character
+    substring of a lowercased name to the ids containing it; a term is
+    matched by intersecting the postings of its own trigrams, smallest
+    first, and checking the few remaining names. Terms shorter than a
+    trigram are checked against every name.
+'''
+class NameIndex(Reloadable):
+    def __init__(self, max_age=None):
+        Reloadable.__init__(self, max_age)
+        self._names = {}
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def load(self, rows):
+        '''
+        load(rows)
+            rebuilds the index from (id, name) rows
+        '''
+        with self._lock:
+            self._names = {}
+            self._postings = {}
+            for name_id, name in rows:
+                self._add(name_id, name)
+            self._loaded_at = time.monotonic()
+
+    def add(self, name_id, name):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._remove(name_id)
+            self._add(name_id, name)
+
+    def remove(self, name_id):
+        with self._lock:
+            self._remove(name_id)
+
+    def _add(self, name_id, name):
+        folded = fold(name)
+        self._names[name_id] = (folded, name)
+        for gram in grams(folded):
+            self._postings.setdefault(gram, set()).add(name_id)
+
+    def _remove(self, name_id):
+        entry = self._names.pop(name_id, None)
+        if entry is None:
+            return
+        for gram in grams(entry[0]):
+            postings = self._postings[gram]
+            postings.discard(name_id)
+            if not postings:
+                del self._postings[gram]
+
+    def _matches(self, term):
+        if len(term) < GRAM:
+            candidates = self._names
+        else:
+            postings = sorted((self._postings.get(gram, ()) for gram in grams(term)), key=len)
+            if not postings[0]:
+                return []
+            candidates = set(postings[0]).intersection(*postings[1:])
+        return [name_id for name_id in candidates if term in self._names[name_id][0]]
+
+    def search(self, term, limit=None):
+        '''
+        search(term, limit)
+            ([(id, name)] of names containing `term`, ordered by name), total matches
+        '''
+        term = fold(term)
+        with self._lock:
+            matches = self._matches(term)
+            key = lambda name_id: (self._names[name_id][0], name_id)
+            if limit is None:
+                ids = sorted(matches, key=key)
+            else:
+                ids = heapq.nsmallest(limit, matches, key=key)
+            return [(name_id, self._names[name_id][1]) for name_id in ids], len(matches)
+
+    def complete(self, term, limit=10):
+        '''
+        complete(term, limit)
+            up to `limit` (id, name) for a search box: names starting with
+            `term` first, then names containing it, each ordered by name
+        '''
+        term = fold(term)
+        with self._lock:
+            matches = self._matches(term)
+            names = self._names
+            ids = heapq.nsmallest(limit, matches, key=lambda name_id: (
+                not names[name_id][0].startswith(term), names[name_id][0], name_id))
+            return [(name_id, names[name_id][1]) for name_id in ids]
+
+
+'''
+PrefixCache
+    bounded LRU of autocomplete results keyed by (kind, prefix, limit).
+    Entries older than `max_age` seconds are recomputed; clear() drops
+    everything after a venue or artist is written.
+'''
+class PrefixCache:
+    def __init__(self, max_size=2048, max_age=60):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.max_age:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            generation = self._generation
+        self.misses += 1
+        value = compute()
+        with self._lock:
+            if generation != self._generation:
+                # cleared while computing, the value may predate the write
+                return value
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
@@ -0,0 +1,253 @@
+import html
+import re
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from app import app, db, Venue, Artist, Show, SHOWS_PER_PAGE, MAX_AUTOCOMPLETE_LIMIT, page_cache, area_summary, \
+    venue_names, artist_names, venue_show_counts, artist_show_counts, autocomplete_cache
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['TESTING'] = True
+        self.client = app.test_client
+        self.context = app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        page_cache.clear()
+        autocomplete_cache.clear()
+        for index in (area_summary, venue_names, artist_names, venue_show_counts, artist_show_counts):
+            index.invalidate()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        self.context.pop()
+
+    def add_shows(self, venue_id, artist_id, count, days=1):
+        start = datetime.now() + timedelta(days=days)
+        db.session.add_all([Show(venue_id=venue_id, artist_id=artist_id, start_time=start + timedelta(hours=i))
+                            for i in range(count)])
+        db.session.commit()
+
+    def past_shows(self, venue_id, count):
+        start = datetime.now() - timedelta(days=1)
+        # pairs of shows at the same time, so paging has to break ties on id
+        db.session.add_all([Show(venue_id=venue_id, artist_id=1, start_time=start - timedelta(hours=i // 2))
+                            for i in range(count)])
+        db.session.commit()
+
+    def search(self, kind, term):
+        res = self.client().post('/{}/search'.format(kind), data={'search_term': term})
+        self.assertEqual(res.status_code, 200)
+        data = res.data.decode()
+        count = int(re.search(r'Number of search results for ".*": (\d+)', data).group(1))
+        return count, [html.unescape(name) for name in re.findall(r'<h5>(.*?)</h5>', data)]
+
+    def complete(self, query):
+        res = self.client().get('/search/autocomplete?' + query)
+        self.assertEqual(res.status_code, 200)
+        return res.get_json()
+
+    def areas(self):
+        res = self.client().get('/venues')
+        self.assertEqual(res.status_code, 200)
+        headers = re.findall(r'<h3>(.*?)</h3>', res.data.decode())
+        self.assertEqual(headers, ['{}, {}'.format(area['city'], area['state']) for area in area_summary.areas()])
+        return {(area['city'], area['state']): [(venue['name'], venue['num_upcoming_shows']) for venue in area['venues']]
+                for area in area_summary.areas()}
+
+    def upcoming_count(self, url):
+        res = self.client().get(url)
+        self.assertEqual(res.status_code, 200)
+        return int(re.search(r'(\d+) Upcoming', res.data.decode()).group(1))
+
+    def test_delete_venue_invalidates_artist_pages(self):
+        db.session.add_all([Venue(name='Hop'), Venue(name='Park'), Artist(name='Sax')])
+        db.session.commit()
+        self.add_shows(1, 1, 25)
+        self.add_shows(2, 1, 5, days=30)
+        # the first two pages only show venue 1, yet their counts include venue 2
+        self.assertEqual(self.upcoming_count('/artists/1'), 30)
+        self.assertEqual(self.upcoming_count('/artists/1?upcoming_page=2'), 30)
+
+        res = self.client().delete('/venues/2')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.get_json()['success'])
+        self.assertEqual(Show.query.count(), 25)
+        self.assertEqual(self.upcoming_count('/artists/1'), 25)
+        self.assertEqual(self.upcoming_count('/artists/1?upcoming_page=2'), 25)
+
+    def test_venue_past_shows_keyset_pages(self):
+        db.session.add_all([Venue(name='Hop'), Artist(name='Sax')])
+        db.session.commit()
+        self.past_shows(1, 2 * SHOWS_PER_PAGE + 5)
+        url, pages, shown = '/venues/1', 0, 0
+
+        while url:
+            res = self.client().get(url)
+            data = res.data.decode()
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('{} Past Shows'.format(2 * SHOWS_PER_PAGE + 5), data)
+            pages += 1
+            shown += data.split('Past Shows')[1].count('tile-show')
+            older = re.search(r'href="\?(past_before=[^"]+)"', data)
+            url = '/venues/1?' + html.unescape(older.group(1)) if older else None
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(shown, 2 * SHOWS_PER_PAGE + 5)
+
+    def test_show_counts_follow_new_shows(self):
+        db.session.add_all([Venue(name='Hop'), Artist(name='Sax')])
+        db.session.commit()
+        self.add_shows(1, 1, 3)
+        self.assertEqual(self.upcoming_count('/venues/1'), 3)
+        self.assertEqual(self.upcoming_count('/artists/1'), 3)
+
+        res = self.client().post('/shows/create', data={
+            'venue_id': '1',
+            'artist_id': '1',
+            'start_time': (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d %H:%M:%S'),
+        })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(venue_show_counts), 1)
+        self.assertEqual(self.upcoming_count('/venues/1'), 4)
+        self.assertEqual(self.upcoming_count('/artists/1'), 4)
+
+    def test_venues_grouped_by_area(self):
+        db.session.add_all([Venue(name='The Musical Hop', city='San Francisco', state='CA'),
+                            Venue(name='Park Square', city='San Francisco', state='CA'),
+                            Venue(name='The Dueling Pianos Bar', city='New York', state='NY'),
+                            Artist(name='Sax')])
+        db.session.commit()
+        self.add_shows(1, 1, 2)
+        self.past_shows(1, 3)
+
+        self.assertEqual(self.areas(), {
+            ('San Francisco', 'CA'): [('Park Square', 0), ('The Musical Hop', 2)],
+            ('New York', 'NY'): [('The Dueling Pianos Bar', 0)],
+        })
+
+    def test_venues_follow_writes(self):
+        db.session.add_all([Venue(name='The Musical Hop', city='San Francisco', state='CA'), Artist(name='Sax')])
+        db.session.commit()
+        self.assertEqual(self.areas(), {('San Francisco', 'CA'): [('The Musical Hop', 0)]})
+
+        self.client().post('/venues/create', data={
+            'name': 'The Dueling Pianos Bar',
+            'city': 'New York',
+            'state': 'NY',
+            'address': '335 Delancey Street',
+            'phone': '914-003-1132',
+            'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/theduelingpianos',
+        })
+        self.client().post('/shows/create', data={
+            'venue_id': '1',
+            'artist_id': '1',
+            'start_time': (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        self.assertEqual(self.areas(), {
+            ('San Francisco', 'CA'): [('The Musical Hop', 1)],
+            ('New York', 'NY'): [('The Dueling Pianos Bar', 0)],
+        })
+
+        res = self.client().delete('/venues/1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.areas(), {('New York', 'NY'): [('The Dueling Pianos Bar', 0)]})
+
+    def test_venues_reload_when_next_show_starts(self):
+        db.session.add_all([Venue(name='The Musical Hop', city='San Francisco', state='CA'), Artist(name='Sax')])
+        db.session.commit()
+        start = datetime.now() + timedelta(seconds=0.5)
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=start))
+        db.session.commit()
+        self.assertEqual(self.areas(), {('San Francisco', 'CA'): [('The Musical Hop', 1)]})
+        self.assertEqual(area_summary.valid_until, start)
+
+        time.sleep(max(0, (start - datetime.now()).total_seconds()) + 0.1)
+
+        self.assertEqual(self.areas(), {('San Francisco', 'CA'): [('The Musical Hop', 0)]})
+        self.assertIsNone(area_summary.valid_until)
+
+    def test_search_venues_case_insensitive_substring(self):
+        db.session.add_all([Venue(name='The Musical Hop'), Venue(name='Park Square Live Music & Coffee'),
+                            Venue(name='The Dueling Pianos Bar')])
+        db.session.commit()
+
+        self.assertEqual(self.search('venues', 'Hop'), (1, ['The Musical Hop']))
+        self.assertEqual(self.search('venues', 'music'),
+                         (2, ['Park Square Live Music & Coffee', 'The Musical Hop']))
+        self.assertEqual(self.search('venues', 'jazz'), (0, []))
+
+    def test_search_escapes_like_wildcards(self):
+        db.session.add_all([Artist(name='100% Sax'), Artist(name='1000 Saxes'), Artist(name='the_band'),
+                            Artist(name='the band')])
+        db.session.commit()
+
+        self.assertEqual(self.search('artists', '100%'), (1, ['100% Sax']))
+        self.assertEqual(self.search('artists', 'the_'), (1, ['the_band']))
+
+    def test_autocomplete_orders_prefix_matches_first(self):
+        db.session.add_all([Artist(name='The Wild Sax Band'), Artist(name='Sax Quartet'), Artist(name='Saxophone')])
+        db.session.commit()
+
+        data = self.complete('q=sax&type=artists')
+
+        self.assertEqual([a['name'] for a in data['artists']], ['Sax Quartet', 'Saxophone', 'The Wild Sax Band'])
+        self.assertNotIn('venues', data)
+
+    def test_autocomplete_clamps_limit(self):
+        db.session.add_all([Venue(name='Hall {:02}'.format(i)) for i in range(MAX_AUTOCOMPLETE_LIMIT + 5)])
+        db.session.commit()
+
+        self.assertEqual(len(self.complete('q=hall&type=venues&limit=1000')['venues']), MAX_AUTOCOMPLETE_LIMIT)
+        self.assertEqual(len(self.complete('q=hall&type=venues&limit=-3')['venues']), 1)
+        self.assertEqual(self.complete('q=hall&limit=2'), {
+            'venues': [{'id': 1, 'name': 'Hall 00'}, {'id': 2, 'name': 'Hall 01'}],
+            'artists': [],
+        })
+
+    def test_400_autocomplete_unknown_type(self):
+        res = self.client().get('/search/autocomplete?q=hop&type=shows')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_autocomplete_sees_new_venue(self):
+        db.session.add(Venue(name='The Musical Hop'))
+        db.session.commit()
+        self.assertEqual(len(self.complete('q=hop&type=venues')['venues']), 1)
+
+        res = self.client().post('/venues/create', data={
+            'name': 'Hop Scotch',
+            'city': 'San Francisco',
+            'state': 'CA',
+            'address': '1 Main St',
+            'phone': '123-123-1234',
+            'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/hopscotch',
+        })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([v['name'] for v in self.complete('q=hop&type=venues')['venues']],
+                         ['Hop Scotch', 'The Musical Hop'])
+
+    def test_404_delete_missing_venue(self):
+        res = self.client().delete('/venues/5')
+
+        self.assertEqual(res.status_code, 404)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import re
+import time
+import unicodedata
+
+from reloadable import Reloadable
+
+ARTICLES = frozenset(('a', 'an', 'the'))
+APOSTROPHE_RE = re.compile(r"['’`]")
+WORD_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def normalize_answer(text):
+    '''
+    normalize_answer(text)
+        canonical form used for grading: accents stripped, case folded,
+        apostrophes dropped, other punctuation treated as spaces, and the
+        articles a/an/the removed ("The Beatles!" -> "beatles")
+    '''
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    words = WORD_RE.findall(APOSTROPHE_RE.sub('', text))
+    kept = [w for w in words if w not in ARTICLES]
+    return ' '.join(kept or words)
+
+
+def split_numbers(normalized):
+    '''
+    split_numbers(normalized)
+        (words, numbers) of a normalized answer: tokens containing a digit
+        ("13", "1930", "b52") must match exactly, typos are only tolerated in
+        the remaining words
+    '''
+    words, numbers = [], []
+    for token in normalized.split():
+        (numbers if any(c.isdigit() for c in token) else words).append(token)
+    return ' '.join(words), tuple(numbers)
+
+
+def max_distance(normalized):
+    '''
+    max_distance(normalized)
+        typos tolerated for an answer of this length: none for short answers
+        like "one", growing to 3 for long ones
+    '''
+    n = len(normalized)
+    if n <= 3:
+        return 0
+    if n <= 6:
+        return 1
+    if n <= 12:
+        return 2
+    return 3
+
+
+def edit_distance(a, b, limit):
+    '''
+    edit_distance(a, b, limit)
+        Levenshtein distance of a and b, or limit + 1 as soon as it is known to
+        exceed limit. The common prefix and suffix are skipped and only the
+        diagonal band of width 2 * limit + 1 is computed.
+    '''
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a = a[start:len(a) - end]
+    b = b[start:len(b) - end]
+    if len(a) > len(b):
+        a, b = b, a
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(a) + 1)]
+    for i, cb in enumerate(b, 1):
+        current = [over] * (len(a) + 1)
+        current[0] = i if i <= limit else over
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(len(a), i + limit) + 1):
+            d = min(previous[j - 1] + (a[j - 1] != cb), previous[j] + 1, current[j - 1] + 1)
+            current[j] = d if d <= limit else over
+            row_min = min(row_min, current[j])
+        if row_min > limit:
+            return over
+        previous = current
+    return previous[-1]
+
+
+'''
+AnswerIndex
+    normalized answer, its numbers and the typo threshold of its words per
+    question id, computed when a question is indexed, so grading only
+    normalizes the player's answer and runs a banded edit distance against
+    the stored words.
+'''
+class AnswerIndex(Reloadable):
+    def __init__(self, max_age=None):
+        Reloadable.__init__(self, max_age)
+        self._answers = {}
+
+    def load(self, rows):
+        '''
+        load(rows)
+            rebuilds the index from (id, answer) rows
+        '''
+        answers = {}
+        for question_id, answer in rows:
+            answers[question_id] = self._entry(answer)
+        with self._lock:
+            self._answers = answers
+            self._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _entry(answer):
+        normalized = normalize_answer(answer)
+        words, numbers = split_numbers(normalized)
+        return normalized, words, numbers, max_distance(words), answer
+
+    def add(self, question_id, answer):
+        entry = self._entry(answer)
+        with self._lock:
+            self._answers[question_id] = entry
+
+    def remove(self, question_id):
+        with self._lock:
+            self._answers.pop(question_id, None)
+
+    def grade(self, question_id, answer):
+        '''
+        grade(question_id, answer)
+            (correct, expected answer) for a player's answer, or None if the question is not indexed
+        '''
+        entry = self._answers.get(question_id)
+        if entry is None:
+            return None
+        expected, expected_words, expected_numbers, limit, original = entry
+        given = normalize_answer(answer)
+        if given == expected:
+            return True, original
+        words, numbers = split_numbers(given)
+        if numbers != expected_numbers:
+            return False, original
+        return edit_distance(words, expected_words, limit) <= limit, original
@@ -0,0 +1,416 @@
+'''
+benchmark.py
+    reproducible HTTP benchmark for the trivia API.
+
+    Seeds a database with --scale questions, then drives every route of
+    flaskr through the Flask test client and through a real threaded WSGI
+    server. Reports throughput, p50/p95/p99 latency and SQL statements per
+    request as JSON, so runs from different commits can be compared.
+
+    python benchmark.py --scale 100000 --output bench.json
+    python benchmark.py --database-url postgresql://localhost/trivia_bench --reset
+    python benchmark.py --compare before.json after.json
+'''
+import argparse
+import contextlib
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.serving import make_server
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+WORDS = ('ancient river painter soccer world cup palace mirror lake africa penicillin blood '
+         'organ liver movie oscar boxer peanut dutch artist beetle egypt title fantasy').split()
+
+
+class SQLCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(Engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def seed(db, Question, Category, scale, rng, batch_size=5000):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(Category.__table__.insert(), [{'id': i + 1, 'type': t} for i, t in enumerate(CATEGORIES)])
+    batch = []
+    for i in range(scale):
+        batch.append({
+            'question': ' '.join(rng.choice(WORDS) for _ in range(8)) + '?',
+            'answer': rng.choice(WORDS),
+            'category': rng.randint(1, len(CATEGORIES)),
+            'difficulty': rng.randint(1, 5),
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(Question.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Question.__table__.insert(), batch)
+    db.session.commit()
+
+
+'''
+build_routes(scale, rng)
+    one entry per route: (name, request factory, iteration share, response recorder).
+    A factory gets the shared state dict and returns (method, path, json body, headers);
+    the optional recorder stores ids from responses that later routes need.
+'''
+def build_routes(scale, rng):
+    pages = max(1, scale // 10)
+
+    def categories(state):
+        return 'GET', '/categories', None, {}
+
+    def categories_conditional(state):
+        return 'GET', '/categories', None, {'If-None-Match': state.get('categories_etag', '')}
+
+    def questions_page(state):
+        return 'GET', '/questions?page={}'.format(rng.randint(1, pages)), None, {}
+
+    def questions_cursor(state):
+        return 'GET', '/questions?after_id={}'.format(rng.randint(0, scale)), None, {}
+
+    def category_questions(state):
+        return 'GET', '/categories/{}/questions?page={}'.format(
+            rng.randint(1, len(CATEGORIES)), rng.randint(1, max(1, pages // len(CATEGORIES)))), None, {}
+
+    def search(state):
+        return 'GET', '/questions/search?t={}'.format(rng.choice(WORDS)[:rng.randint(3, 6)]), None, {}
+
+    def create_question(state):
+        body = {'question': 'bench question', 'answer': 'bench', 'category': rng.randint(1, 6), 'difficulty': 3}
+        return 'POST', '/questions', body, {}
+
+    def create_question_minimal(state):
+        method, path, body, headers = create_question(state)
+        return method, path, body, {'Prefer': 'return=minimal'}
+
+    def delete_question_minimal(state):
+        method, path, body, headers = delete_question(state)
+        return method, path, body, {'Prefer': 'return=minimal'}
+
+    def delete_question(state):
+        created = state['created']
+        question_id = created.pop() if created else rng.randint(1, scale)
+        return 'DELETE', '/questions/{}'.format(question_id), None, {}
+
+    def bulk_delete(state):
+        created = state['created']
+        ids = [created.pop() for _ in range(min(10, len(created)))] or [rng.randint(1, scale)]
+        return 'DELETE', '/questions?ids={}'.format(','.join(str(i) for i in ids)), None, {}
+
+    def quiz(state):
+        category = rng.randint(0, len(CATEGORIES))
+        body = {
+            'previous_questions': [rng.randint(1, scale) for _ in range(rng.randint(0, 10))],
+            'quiz_category': {'type': 'click', 'id': 0} if category == 0 else {'type': CATEGORIES[category - 1], 'id': category - 1},
+        }
+        return 'POST', '/quizzes', body, {}
+
+    def quiz_batch(state):
+        body = {'quiz_category': {'type': 'click', 'id': 0}, 'count': 20}
+        return 'POST', '/quizzes', body, {}
+
+    def quiz_weighted(state):
+        body = {'quiz_category': {'type': 'click', 'id': 0}, 'count': 20, 'weighting': 'adaptive',
+                'recent_results': [True, False, True]}
+        return 'POST', '/quizzes', body, {}
+
+    def quiz_answer(state):
+        body = {'question_id': rng.randint(1, scale), 'answer': rng.choice(WORDS)}
+        return 'POST', '/quizzes/answer', body, {}
+
+    def quiz_answer_scored(state):
+        body = {'question_id': rng.randint(1, scale), 'answer': rng.choice(WORDS),
+                'player': 'player{}'.format(rng.randint(1, 1000))}
+        return 'POST', '/quizzes/answer', body, {}
+
+    def leaderboard(state):
+        return 'GET', '/leaderboard?limit=10', None, {}
+
+    def quiz_session_create(state):
+        return 'POST', '/quizzes/sessions', {}, {}
+
+    def quiz_session_play(state):
+        return 'POST', '/quizzes', {'session_id': state.get('session_id', '')}, {}
+
+    def quiz_session_delete(state):
+        sessions = state['sessions']
+        session_id = sessions.pop() if sessions else state.get('session_id', '')
+        return 'DELETE', '/quizzes/sessions/{}'.format(session_id), None, {}
+
+    def bulk_import(state):
+        lines = [json.dumps({'question': 'imported', 'answer': 'a', 'category': 1, 'difficulty': 1}) for _ in range(100)]
+        return 'POST', '/questions/import', '\n'.join(lines), {'Content-Type': 'application/x-ndjson'}
+
+    def bulk_export(state):
+        return 'GET', '/questions/export', None, {}
+
+    def metrics(state):
+        return 'GET', '/metrics', None, {}
+
+    return [
+        ('GET /categories', categories, 1),
+        ('GET /categories (304)', categories_conditional, 1),
+        ('GET /questions?page', questions_page, 1),
+        ('GET /questions?after_id', questions_cursor, 1),
+        ('GET /categories/<id>/questions', category_questions, 1),
+        ('GET /questions/search', search, 1),
+        ('POST /questions', create_question, 1, record_created),
+        ('DELETE /questions/<id>', delete_question, 1),
+        ('POST /questions (minimal)', create_question_minimal, 1, record_created),
+        ('DELETE /questions/<id> (minimal)', delete_question_minimal, 1),
+        ('DELETE /questions?ids= (10 ids)', bulk_delete, 0.1),
+        ('POST /quizzes', quiz, 1),
+        ('POST /quizzes (count=20)', quiz_batch, 1),
+        ('POST /quizzes (adaptive, count=20)', quiz_weighted, 1),
+        ('POST /quizzes/answer', quiz_answer, 1),
+        ('POST /quizzes/answer (scored)', quiz_answer_scored, 1),
+        ('GET /leaderboard', leaderboard, 1),
+        ('POST /quizzes/sessions', quiz_session_create, 0.1, record_session),
+        ('POST /quizzes (session)', quiz_session_play, 1),
+        ('DELETE /quizzes/sessions/<id>', quiz_session_delete, 0.1, record_session),
+        ('POST /questions/import', bulk_import, 0.1),
+        ('GET /questions/export', bulk_export, 0.02),
+        ('GET /metrics', metrics, 0.1),
+    ]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+def summarize(latencies, elapsed, sql, statuses):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return {
+        'requests': n,
+        'throughput_rps': round(n / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'sql_per_request': round(sql / n, 2) if n else None,
+        'status': statuses,
+    }
+
+
+def record_created(state, status, data):
+    if status == 200:
+        try:
+            state['created'].append(json.loads(data)['id'])
+        except (ValueError, KeyError):
+            pass
+
+
+def record_session(state, status, data):
+    if status == 200:
+        body = json.loads(data)
+        if 'session_id' in body:
+            state['session_id'] = body['session_id']
+            state['sessions'].append(body['session_id'])
+        elif body.get('deleted') == state.get('session_id'):
+            # later session requests should not target a deleted session
+            state.pop('session_id')
+
+
+def run_test_client(app, routes, iterations, sql_counter):
+    client = app.test_client()
+    state = {'created': [], 'sessions': [], 'categories_etag': client.get('/categories').headers.get('ETag', '')}
+    results = {}
+    for name, factory, share, *record in routes:
+        n = max(1, int(iterations * share))
+        latencies, statuses = [], {}
+        sql_before = sql_counter.count
+        started = time.perf_counter()
+        for _ in range(n):
+            method, path, body, headers = factory(state)
+            t0 = time.perf_counter()
+            if isinstance(body, str):
+                res = client.open(path, method=method, data=body, headers=headers)
+            else:
+                res = client.open(path, method=method, json=body, headers=headers)
+            data = res.get_data()
+            latencies.append(time.perf_counter() - t0)
+            statuses[str(res.status_code)] = statuses.get(str(res.status_code), 0) + 1
+            if record:
+                record[0](state, res.status_code, data)
+        results[name] = summarize(latencies, time.perf_counter() - started, sql_counter.count - sql_before, statuses)
+    return results
+
+
+def run_server(app, routes, iterations, sql_counter, concurrency):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_port
+    local = threading.local()
+    lock = threading.Lock()
+
+    def send(method, path, body, headers):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection('127.0.0.1', port)
+        headers = dict(headers)
+        if body is not None and not isinstance(body, str):
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        t0 = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            res = conn.getresponse()
+            data = res.read()
+        except (http.client.HTTPException, OSError):
+            local.conn = None
+            conn.close()
+            raise
+        return time.perf_counter() - t0, res.status, data, res.getheader('ETag', '')
+
+    try:
+        state = {'created': [], 'sessions': []}
+        state['categories_etag'] = send('GET', '/categories', None, {})[3]
+        results = {}
+        for name, factory, share, *record in routes:
+            n = max(1, int(iterations * share))
+            # built up front so the shared rng is only used from this thread
+            requests = [factory(state) for _ in range(n)]
+            latencies, statuses = [], {}
+
+            def one(spec):
+                latency, status, data, _ = send(*spec)
+                with lock:
+                    latencies.append(latency)
+                    statuses[str(status)] = statuses.get(str(status), 0) + 1
+                    if record:
+                        record[0](state, status, data)
+
+            sql_before = sql_counter.count
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(one, requests))
+            results[name] = summarize(latencies, time.perf_counter() - started, sql_counter.count - sql_before, statuses)
+        return results
+    finally:
+        server.shutdown()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    before = json.load(open(before_path))
+    after = json.load(open(after_path))
+    print('{:<10} {:<34} {:>12} {:>12} {:>9}'.format('mode', 'route', 'p95 before', 'p95 after', 'change'))
+    for mode, routes in after['results'].items():
+        for route, stats in routes.items():
+            old = before['results'].get(mode, {}).get(route)
+            if not old:
+                continue
+            change = (stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+            print('{:<10} {:<34} {:>12.3f} {:>12.3f} {:>+8.1f}%'.format(mode, route, old['p95_ms'], stats['p95_ms'], change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the trivia API.')
+    parser.add_argument('--scale', type=int, default=10000, help='number of questions to seed')
+    parser.add_argument('--iterations', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads against the WSGI server')
+    parser.add_argument('--database-url', help='database to seed (default: temporary SQLite file)')
+    parser.add_argument('--reset', action='store_true', help='allow dropping the tables of --database-url')
+    parser.add_argument('--mode', choices=['all', 'test-client', 'server'], default='all')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for data and requests')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two reports and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    tmp = None
+    database_url = args.database_url
+    if database_url is None:
+        tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        tmp.close()
+        database_url = 'sqlite:///' + tmp.name
+    elif not database_url.startswith('sqlite') and not args.reset:
+        parser.error('seeding drops the trivia tables of {}; pass --reset to confirm'.format(database_url))
+
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    from flaskr import create_app
+    from models import db, Question, Category, score_buffer
+
+    rng = random.Random(args.seed)
+    sql_counter = SQLCounter()
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'database': database_url.split(':', 1)[0],
+            'scale': args.scale,
+            'iterations': args.iterations,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+        },
+        'results': {},
+    }
+    app = None
+    try:
+        # routes print diagnostics; keep them out of the timings and the report
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            app = create_app()
+            with app.app_context():
+                started = time.perf_counter()
+                seed(db, Question, Category, args.scale, rng)
+                report['meta']['seed_seconds'] = round(time.perf_counter() - started, 2)
+            routes = build_routes(args.scale, rng)
+            if args.mode in ('all', 'test-client'):
+                report['results']['test-client'] = run_test_client(app, routes, args.iterations, sql_counter)
+            if args.mode in ('all', 'server'):
+                report['results']['server'] = run_server(app, routes, args.iterations, sql_counter, args.concurrency)
+    finally:
+        if app is not None:
+            # the buffered scores are written before the database goes away, not at exit
+            with app.app_context():
+                score_buffer.close()
+                db.engine.dispose()
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+import csv
+import io
+import json
+
+import click
+
+from models import db, Question, QUESTION_FIELDS, quiz_index, search_index, answer_index, versions
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+FORMATS = ('ndjson', 'csv')
+
+
+def guess_format(name, default='ndjson'):
+    if name and (name.endswith('.csv') or name == 'text/csv'):
+        return 'csv'
+    return default
+
+
+def iter_ndjson(lines):
+    '''
+    iter_ndjson(lines)
+        yields (line number, record or error message) for each non-empty line
+    '''
+    for n, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield n, json.loads(line)
+        except ValueError as e:
+            yield n, str(e)
+
+
+def iter_csv(lines):
+    '''
+    iter_csv(lines)
+        same as iter_ndjson for CSV input with a header row
+    '''
+    lines = (line.decode('utf-8') if isinstance(line, bytes) else line for line in lines)
+    reader = csv.DictReader(lines)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def to_row(record):
+    if not isinstance(record, dict):
+        raise ValueError(record)
+    row = {}
+    for field in ('question', 'answer', 'category', 'difficulty'):
+        if record.get(field) in (None, ''):
+            raise ValueError('missing {}'.format(field))
+        row[field] = record[field]
+    row['category'] = int(row['category'])
+    row['difficulty'] = int(row['difficulty'])
+    if record.get('id') not in (None, ''):
+        row['id'] = int(record['id'])
+    return row
+
+
+def _flush(batch):
+    # one executemany + one commit per batch, rows with explicit ids go separately
+    # because executemany needs the same keys on every row
+    with_id = [row for row in batch if 'id' in row]
+    without_id = [row for row in batch if 'id' not in row]
+    for rows in (with_id, without_id):
+        if rows:
+            db.session.execute(Question.__table__.insert(), rows)
+    db.session.commit()
+    return bool(with_id)
+
+
+def import_questions(lines, format='ndjson', batch_size=BATCH_SIZE):
+    '''
+    import_questions(lines, format, batch_size)
+        parses NDJSON or CSV lines incrementally and inserts them in batched
+        transactions. Input is only pulled while the current batch is filling, so a
+        slow database throttles the reader instead of buffering the whole upload.
+        Invalid rows are skipped and reported. Returns {'imported', 'failed', 'errors'}.
+    '''
+    records = iter_csv(lines) if format == 'csv' else iter_ndjson(lines)
+    result = {'imported': 0, 'failed': 0, 'errors': []}
+    batch = []
+    explicit_ids = False
+    try:
+        for n, record in records:
+            try:
+                batch.append(to_row(record))
+            except (ValueError, TypeError) as e:
+                result['failed'] += 1
+                if len(result['errors']) < MAX_REPORTED_ERRORS:
+                    result['errors'].append({'line': n, 'error': str(e)})
+                continue
+            if len(batch) >= batch_size:
+                explicit_ids = _flush(batch) or explicit_ids
+                result['imported'] += len(batch)
+                batch = []
+        if batch:
+            explicit_ids = _flush(batch) or explicit_ids
+            result['imported'] += len(batch)
+    finally:
+        db.session.rollback()
+        if result['imported']:
+            if explicit_ids and db.engine.dialect.name == 'postgresql':
+                db.session.execute(
+                    "SELECT setval(pg_get_serial_sequence('questions', 'id'), "
+                    "(SELECT MAX(id) FROM questions))")
+                db.session.commit()
+            # rebuilt lazily on next use rather than row by row
+            quiz_index.invalidate()
+            search_index.invalidate()
+            answer_index.invalidate()
+            versions.bump('questions')
+    return result
+
+
+def iter_question_rows(batch_size=BATCH_SIZE):
+    '''
+    iter_question_rows(batch_size)
+        walks the questions table in id order with keyset batches of plain column
+        tuples, so memory stays flat regardless of table size
+    '''
+    last_id = None
+    while True:
+        q = Question.rows().order_by(Question.id)
+        if last_id is not None:
+            q = q.filter(Question.id > last_id)
+        rows = q.limit(batch_size).all()
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        last_id = rows[-1][0]
+
+
+def export_questions(format='ndjson', batch_size=BATCH_SIZE):
+    '''
+    export_questions(format, batch_size)
+        yields the questions table as NDJSON or CSV text chunks
+    '''
+    if format == 'csv':
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(QUESTION_FIELDS)
+        for row in iter_question_rows(batch_size):
+            writer.writerow(row)
+            if buf.tell() > 64 * 1024:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+        return
+
+    for row in iter_question_rows(batch_size):
+        yield json.dumps(Question.format_row(row)) + '\n'
+
+
+'''
+register_cli(app)
+    adds `flask import-questions` and `flask export-questions`
+'''
+def register_cli(app):
+    @app.cli.command('import-questions')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None)
+    @click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+    def import_questions_command(source, fmt, batch_size):
+        """Import questions from an NDJSON or CSV file ('-' for stdin)."""
+        result = import_questions(source, fmt or guess_format(source.name), batch_size)
+        click.echo('imported {imported}, failed {failed}'.format(**result))
+        for error in result['errors']:
+            click.echo('line {line}: {error}'.format(**error), err=True)
+
+    @app.cli.command('export-questions')
+    @click.argument('target', type=click.File('w', encoding='utf-8'), default='-')
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None)
+    @click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+    def export_questions_command(target, fmt, batch_size):
+        """Export questions as NDJSON or CSV ('-' for stdout)."""
+        for chunk in export_questions(fmt or guess_format(target.name), batch_size):
+            target.write(chunk)
@@ -1,17 +1,243 @@
 import os
-from flask import Flask, request, abort, jsonify
+import time
+import base64
+import binascii
+from collections.abc import Mapping
+from datetime import datetime
+from functools import wraps
+from flask import Flask, request, abort, jsonify, Response, stream_with_context, make_response, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category
+from models import db, setup_db, unit_of_work, Question, Score, category_cache, versions, score_buffer, replicas
+from bulk import FORMATS, guess_format, import_questions, export_questions, register_cli
+from metrics import metrics
+from pool import pool_stats
+from quiz import encode_seen, decode_seen, difficulty_weights, QuizSessionStore, WEIGHTINGS, MAX_SEEN_IDS
 
 QUESTIONS_PER_PAGE = 10
+MAX_QUESTIONS_PER_PAGE = 100
+MAX_QUIZ_BATCH = 50
+MAX_LEADERBOARD = 100
+MAX_PLAYER_LENGTH = 80
+MAX_BULK_DELETE = 1000
+READ_PRIMARY_COOKIE = 'read_primary_until'
 
+quiz_sessions = QuizSessionStore(
+    ttl=int(os.getenv('QUIZ_SESSION_TTL', 1800)),
+    max_sessions=int(os.getenv('QUIZ_SESSION_MAX', 10000)))
 
-def create_app(test_config=None):
+metrics.add_gauge('category_cache_hits_total', 'Category cache hits.', 'counter', lambda: category_cache.hits)
+metrics.add_gauge('category_cache_misses_total', 'Category cache misses.', 'counter', lambda: category_cache.misses)
+metrics.add_gauge('quiz_sessions', 'Live server-side quiz sessions.', 'gauge', lambda: len(quiz_sessions))
+metrics.add_gauge('score_buffer_pending', 'Scores waiting to be written.', 'gauge', lambda: len(score_buffer))
+metrics.add_gauge('scores_written_total', 'Scores written in batches.', 'counter', lambda: score_buffer.flushed)
+metrics.add_gauge('score_flush_failures_total', 'Failed score batches.', 'counter', lambda: score_buffer.failures)
+metrics.add_gauge('scores_dropped_total', 'Scores dropped as invalid or past the pending limit.', 'counter',
+                  lambda: score_buffer.rejected + score_buffer.dropped)
+metrics.add_gauge('replica_reads_total', 'Requests served by a read replica.', 'counter', lambda: replicas.reads)
+metrics.add_gauge('replica_failovers_total', 'Replica failures retried on the primary.', 'counter', lambda: replicas.failovers)
+metrics.add_gauge('replicas_healthy', 'Read replicas not marked down.', 'gauge', lambda: replicas.healthy())
+for stat, name, help, kind in (
+        ('size', 'size', 'Connections kept open by the primary pool.', 'gauge'),
+        ('checkedout', 'checked_out', 'Primary pool connections in use.', 'gauge'),
+        ('checkedin', 'checked_in', 'Idle primary pool connections.', 'gauge'),
+        ('overflow', 'overflow', 'Primary pool connections opened beyond the pool size.', 'gauge'),
+        ('checkouts', 'checkouts_total', 'Primary pool checkouts.', 'counter'),
+        ('timeouts', 'timeouts_total', 'Checkouts that gave up after pool_timeout.', 'counter'),
+        ('wait_seconds', 'wait_seconds_total', 'Time spent waiting for primary pool connections.', 'counter'),
+        ('max_wait_seconds', 'max_wait_seconds', 'Longest wait for a primary pool connection.', 'gauge')):
+    metrics.add_gauge('db_pool_' + name, help, kind, lambda stat=stat: pool_stats(db.engine)[stat])
+
+
+def encode_cursor(last_id):
+    '''
+    encode_cursor(last_id)
+        opaque keyset cursor that resumes a listing right after `last_id`
+    '''
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, binascii.Error):
+        abort(400)
+
+
+def conditional(*resources):
+    '''
+    conditional(*resources)
+        answers If-None-Match / If-Modified-Since with 304 from the write counters of
+        `resources` before the view runs, and tags 200 responses with ETag and Last-Modified.
+        A body read from a replica within replicas.lag seconds of a write may predate
+        that write, so it is not tagged with the new version.
+    '''
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            etag = versions.etag(*resources)
+            last_modified = versions.last_modified(*resources)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                # second precision: a write in the current second must not be hidden
+                since = request.if_modified_since
+                not_modified = (since is not None and last_modified <= since.replace(tzinfo=None)
+                                and last_modified < datetime.utcnow().replace(microsecond=0))
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if g.get('replica_read') and versions.written_within(replicas.lag, *resources):
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
+
+
+def read_replica(f):
+    '''
+    read_replica(f)
+        runs a read-only view on a read replica, unless the client wrote within
+        the last replicas.lag seconds (read-your-writes cookie). If the replica
+        fails during the request, the view is run again on the primary.
+    '''
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        until = request.cookies.get(READ_PRIMARY_COOKIE, 0, type=float)
+        if not len(replicas) or (until and until > time.time()):
+            return f(*args, **kwargs)
+        with replicas.reading():
+            try:
+                response = f(*args, **kwargs)
+            except Exception:
+                if not replicas.failed():
+                    raise
+            failed = replicas.failed()
+            g.replica_read = replicas.serving()
+        if not failed:
+            return response
+        db.session.rollback()
+        return f(*args, **kwargs)
+    return wrapper
+
+
+def quiz_category_id(category):
+    '''
+    quiz_category_id(category)
+        category id for a Play tab selection; the frontend sends a zero-based id
+        and type "click" for all categories
+    '''
+    if category['type'] == 'click':
+        return None
+    return int(category['id']) + 1
+
+
+def is_id_list(value):
+    '''
+    is_id_list(value)
+        True for a list of at most MAX_SEEN_IDS positive integer question ids
+    '''
+    return (isinstance(value, list) and len(value) <= MAX_SEEN_IDS
+            and all(type(i) is int and i > 0 for i in value))
+
+
+def get_weighting(data, default='uniform'):
+    weighting = data.get('weighting', default)
+    if weighting not in WEIGHTINGS:
+        abort(400)
+    return weighting
+
+
+def get_player(data, default=None):
+    player = data.get('player', default)
+    if player is not None and (not isinstance(player, str) or not 0 < len(player) <= MAX_PLAYER_LENGTH):
+        abort(400)
+    return player
+
+
+def wants_minimal():
+    '''
+    wants_minimal()
+        true when the client asked for a lean write response with
+        `?return=minimal` or a `Prefer: return=minimal` header (RFC 7240)
+    '''
+    if request.args.get('return') == 'minimal':
+        return True
+    preferences = request.headers.get('Prefer', '').split(',')
+    return any(p.split(';')[0].strip().lower() == 'return=minimal' for p in preferences)
+
+
+def minimal_response(body):
+    '''
+    minimal_response(body)
+        lean write response: the mutated resource plus the new `version` of the
+        questions resource, its write counter in this process
+    '''
+    body['version'] = versions.version('questions')
+    response = jsonify(body)
+    if 'Prefer' in request.headers:
+        response.headers['Preference-Applied'] = 'return=minimal'
+    return response, 200
+
+
+def get_page():
+    page = request.args.get('page', 1, type=int)
+    if page is None or page <= 0:
+        page = 1
+    return page
+
+
+def get_per_page():
+    per_page = request.args.get('per_page', QUESTIONS_PER_PAGE, type=int)
+    if per_page is None or per_page <= 0:
+        per_page = QUESTIONS_PER_PAGE
+    return min(per_page, MAX_QUESTIONS_PER_PAGE)
+
+
+def paginate_questions(query):
+    '''
+    paginate_questions(query)
+        pages an ordered question query and returns (questions, next_cursor).
+        `cursor` or `after_id` switch to keyset (seek) mode: `id > after_id`
+        walks the primary key index so deep pages cost the same as the first one.
+        Otherwise the legacy `page` offset is used.
+        `per_page` overrides QUESTIONS_PER_PAGE, up to MAX_QUESTIONS_PER_PAGE.
+    '''
+    per_page = get_per_page()
+    after_id = request.args.get('after_id', None, type=int)
+    cursor = request.args.get('cursor')
+    if cursor:
+        after_id = decode_cursor(cursor)
+
+    query = query.order_by(Question.id)
+    if after_id is not None:
+        query = query.filter(Question.id > after_id)
+    else:
+        query = query.offset((get_page() - 1) * per_page)
+
+    # fetch one extra row to know whether there is a next page
+    rows = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1].id)
+    return rows, next_cursor
+
+
+def create_app(test_config=None, config=None):
     # create and configure the app
     app = Flask(__name__)
+    # config keys (e.g. DB_POOL_SIZE) are applied before setup_db reads them;
+    # the tests pass the test case itself as test_config, only mappings are config
+    for mapping in (config, test_config):
+        if isinstance(mapping, Mapping):
+            app.config.from_mapping(mapping)
     if test_config is None:
         # database_name = "trivia"
         # database_path = "postgresql://{}/{}".format('postgres:admin@localhost:5432', database_name)
@@ -27,7 +253,13 @@ def create_app(test_config=None):
         db_host = os.getenv('DB_HOST_TEST')
         db_port = os.getenv('DB_PORT_TEST')
     database_path = "postgresql://{}/{}".format(f'{db_user}:{db_pw}@{db_host}:{db_port}', db_name)
-    setup_db(app, database_path)
+    # a full URL (e.g. sqlite:///bench.db) overrides the DB_* settings
+    database_path = os.getenv('DATABASE_URL_TEST' if test_config is not None else 'DATABASE_URL') or database_path
+    # comma separated read replica URLs
+    replica_paths = os.getenv('DATABASE_REPLICA_URLS_TEST' if test_config is not None else 'DATABASE_REPLICA_URLS', '')
+    setup_db(app, database_path, [path.strip() for path in replica_paths.split(',') if path.strip()])
+    register_cli(app)
+    metrics.init_app(app)
     '''
     done @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
     '''
@@ -38,8 +270,11 @@ def create_app(test_config=None):
     '''
     @app.after_request
     def after_request(response):
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type,Authorization,true")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type,Authorization,Prefer,true")
         response.headers.add("Access-Control-Allow-Methods", "GET,PATCH,POST,DELETE,PUT,OPTIONS")
+        if len(replicas) and request.method in ('POST', 'PATCH', 'PUT', 'DELETE') and response.status_code < 400:
+            # keep this client's reads on the primary until replicas caught up
+            response.set_cookie(READ_PRIMARY_COOKIE, str(time.time() + replicas.lag), max_age=int(replicas.lag) + 1)
         return response
 
     '''
@@ -48,10 +283,11 @@ def create_app(test_config=None):
     for all available categories.
     '''
     @app.route('/categories', methods=['GET'])
+    @conditional('categories')
+    @read_replica
     def get_categories():
         try:
-            ret: Category = Category.query.all()
-            categories = [category.format() for category in ret]
+            categories = category_cache.all()
             cnt = len(categories)
             if cnt == 0:
                 # I don't think it's good idea to return 404 if no record found.
@@ -80,29 +316,25 @@ def create_app(test_config=None):
     Clicking on the page numbers should update the questions. 
     '''
     @app.route('/questions', methods=['GET'])
+    @conditional('questions', 'categories')
+    @read_replica
     def get_questions():
         try:
-            page = request.args.get('page', 1, type=int)
-            if page is None or page <= 0:
-                page = 1
-            offset_start = (page - 1) * QUESTIONS_PER_PAGE
-            q = Question.query
-            ret: Question = q.order_by(Question.id).offset(offset_start).limit(QUESTIONS_PER_PAGE).all()
-            questions = [q.format() for q in ret]
-            cnt = len(ret)
-            if cnt == 0:
+            ret, next_cursor = paginate_questions(Question.rows())
+            questions = [Question.format_row(row) for row in ret]
+            if len(questions) == 0:
                 abort(404)
+            cnt = Question.count()
 
 
-            cat: Category = Category.query.all()
-            print(cat)
-            categories = {c.id: c.type for c in cat}
+            categories = category_cache.as_dict()
             print(categories)
             res = {
                 'success': 'true',
                 'questions': questions,
                 'total_questions': cnt,
-                'categories': categories
+                'categories': categories,
+                'next_cursor': next_cursor
             }
             return jsonify(res), 200
         except Exception as err:
@@ -119,16 +351,17 @@ def create_app(test_config=None):
     @app.route('/questions/<question_id>', methods=['DELETE'])
     def delete_question(question_id):
         try:
-            q = Question.query
-            target = q.filter(Question.id == question_id).one_or_none()
+            target = Question.query.filter(Question.id == question_id).one_or_none()
             if target is None:
                 abort(404)
 
             target.delete()
             print(question_id)
-            cnt = q.count()
-            qr: Question = q.order_by(Question.id).offset(0).limit(QUESTIONS_PER_PAGE).all()
-            questions = [q.format() for q in qr]
+            if wants_minimal():
+                return minimal_response({'success': True, 'deleted': target.id})
+            cnt = Question.count()
+            qr = Question.rows().order_by(Question.id).offset(0).limit(QUESTIONS_PER_PAGE).all()
+            questions = [Question.format_row(row) for row in qr]
             # Response body keys: 'success', 'deleted'(id of deleted book),
             # 'books' and 'total_books'
             # Response body keys: 'success', 'books' and 'total_books'
@@ -142,6 +375,35 @@ def create_app(test_config=None):
         except Exception as e:
             print(e)
             abort(422)
+
+    '''
+    Bulk delete: DELETE /questions?ids=1,2,3 removes every listed question in
+    one transaction, ids that do not exist are reported under `not_found`.
+    '''
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions():
+        try:
+            ids = sorted(set(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+        except ValueError:
+            abort(400)
+        if not ids or len(ids) > MAX_BULK_DELETE:
+            abort(400)
+        try:
+            targets = Question.query.filter(Question.id.in_(ids)).all()
+            with unit_of_work():
+                for target in targets:
+                    target.delete()
+            deleted = sorted(target.id for target in targets)
+            return jsonify({
+                'success': True,
+                'deleted': deleted,
+                'not_found': sorted(set(ids) - set(deleted)),
+                'total_questions': Question.count()
+            }), 200
+        except Exception as e:
+            print(e)
+            abort(422)
+
     '''
     @TODO: 
     Create an endpoint to POST a new question, 
@@ -158,7 +420,7 @@ def create_app(test_config=None):
             body = request.get_json()
             question = body['question']
             answer = body['answer']
-            category = body['category']
+            category = int(body['category'])
             difficulty = body['difficulty']
 
             print('post body')
@@ -168,14 +430,16 @@ def create_app(test_config=None):
 
             q: Question = Question(question=question, answer=answer, category=category, difficulty=difficulty)
             q.insert()
-            ret: Question = Question.query.order_by(Question.id).offset(0).limit(QUESTIONS_PER_PAGE).all()
-            questions = [q.format() for q in ret]
+            if wants_minimal():
+                return minimal_response({'success': True, 'id': q.id, 'question': q.format()})
+            ret = Question.rows().order_by(Question.id).offset(0).limit(QUESTIONS_PER_PAGE).all()
+            questions = [Question.format_row(row) for row in ret]
 
             res = {
                 'success': True,
                 'id': q.id,
                 'data': questions,
-                'total_questions': len(questions)
+                'total_questions': Question.count()
             }
             return jsonify(res), 200
         except Exception:
@@ -193,22 +457,17 @@ def create_app(test_config=None):
     Try using the word "title" to start. 
     '''
     @app.route('/questions/search', methods=['GET'])  # I believe "GET" is suitable for search
+    @conditional('questions')
+    @read_replica
     def get_questions_by_term():
         try:
-            search_term = request.args.get('t')
+            search_term = request.args.get('t', '')
             print(search_term)
-            q = Question.query.filter(Question.question.ilike(f'%{search_term}%'))
-            search_results: Question = q.all()
-            search_results = [search_result.format() for search_result in search_results]
-            cnt = q.count()
+            per_page = get_per_page()
+            # ranked hits and their total come back from a single search call
+            search_results, cnt = Question.search(search_term, (get_page() - 1) * per_page, per_page)
+            search_results = [Question.format_row(row) for row in search_results]
             print(search_results, cnt)
-            # search_result = {
-            #     'question': '',
-            #     'answer': '',
-            #     'category': 1,
-            #     'difficulty': 2
-            # }
-
             ret = {
                 'success': True,
                 'questions': search_results,
@@ -220,6 +479,35 @@ def create_app(test_config=None):
             abort(500)
 
 
+    '''
+    Bulk import / export of questions as NDJSON or CSV.
+    Both directions stream: the import reads the request body incrementally and
+    inserts in batched transactions, the export walks the table in keyset batches.
+    '''
+    @app.route('/questions/import', methods=['POST'])
+    def bulk_import_questions():
+        fmt = request.args.get('format') or guess_format(request.mimetype)
+        if fmt not in FORMATS:
+            abort(400)
+        batch_size = request.args.get('batch_size', 1000, type=int)
+        if batch_size is None or batch_size <= 0:
+            abort(400)
+        try:
+            result = import_questions(request.stream, fmt, batch_size)
+        except Exception as e:
+            print(e)
+            abort(422)
+        result['success'] = True
+        return jsonify(result), 200
+
+    @app.route('/questions/export', methods=['GET'])
+    def bulk_export_questions():
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in FORMATS:
+            abort(400)
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(export_questions(fmt)), mimetype=mimetype)
+
     '''
     @TODO: 
     Create a GET endpoint to get questions based on category. 
@@ -228,29 +516,28 @@ def create_app(test_config=None):
     categories in the left column will cause only questions of that 
     category to be shown. 
     '''
-    @app.route('/categories/<cat_id>/questions', methods=['GET'])
+    @app.route('/categories/<int:cat_id>/questions', methods=['GET'])
+    @conditional('questions')
+    @read_replica
     def get_questions_by_category(cat_id):
         try:
-            page = request.args.get('page', 1, type=int)
-            if page is None or page <= 0:
-                page = 1
-            offset_start = (page - 1) * QUESTIONS_PER_PAGE
-            q = Question.query.filter(
+            q = Question.rows().filter(
                 Question.category == cat_id
             )
-            search_results = q.order_by(Question.id).offset(offset_start).limit(QUESTIONS_PER_PAGE).all()
-            search_results = [sr.format() for sr in search_results]
+            search_results, next_cursor = paginate_questions(q)
+            search_results = [Question.format_row(sr) for sr in search_results]
             print(search_results)
-            cnt = q.count()
+            cnt = Question.count(cat_id)
             ret = {
                 'success': True,
                 'questions': search_results,
-                'total_questions': cnt
+                'total_questions': cnt,
+                'next_cursor': next_cursor
             }
             return jsonify(ret), 200
         except Exception as e:
             print(e)
-            abort(500)
+            abort(getattr(e, 'code', 500))
 
 
     '''
@@ -269,41 +556,185 @@ def create_app(test_config=None):
         try:
             data = request.get_json()
             print(data)
-            category = data['quiz_category']
+            session = None
+            if data.get('session_id'):
+                session = quiz_sessions.get(data['session_id'])
+                if session is None:
+                    abort(404)
+            category = data.get('quiz_category')
             print(f'category: {category}')
-            previous_questions = data['previous_questions']
+            previous_questions = data.get('previous_questions', [])
+            if not is_id_list(previous_questions):
+                abort(400)
             print(previous_questions)
             print(len(previous_questions))
-            db_query = Question.query
-            if len(previous_questions) > 0:
-                db_query = db_query.filter(Question.id.notin_(data['previous_questions']))
-            if category['type'] != 'click':
-                db_query = db_query.filter(Question.category == int(category['id']) + 1)
-            # else:
-            #     questions: Question = q.all()
-            questions = db_query.all()
+            if category is not None:
+                category_id = quiz_category_id(category)
+            elif session is not None:
+                category_id = session.category
+            else:
+                abort(400)
+            count = data.get('count')
+            if count is not None and (not isinstance(count, int) or isinstance(count, bool) or count <= 0):
+                abort(400)
+            try:
+                seen_ids = decode_seen(data.get('seen_token'))
+            except ValueError:
+                abort(400)
+            seen_ids.update(previous_questions)
+            if len(seen_ids) > MAX_SEEN_IDS:
+                abort(400)
+            recent_results = data.get('recent_results', [])
+            if not isinstance(recent_results, list):
+                abort(400)
+            if session is not None:
+                # the session bitmap replaces the id list, nothing grows per answer
+                seen = session.seen
+                seen.update(seen_ids)
+                session.results.extend(bool(r) for r in recent_results)
+                recent_results = session.results
+                weighting = get_weighting(data, session.weighting)
+            else:
+                seen = seen_ids
+                weighting = get_weighting(data)
+            weights = difficulty_weights(weighting, recent_results)
 
+            # draw unseen ids from the in-memory index and fetch only those rows
+            index = Question.load_quiz_index()
+            wanted = min(count or 1, MAX_QUIZ_BATCH)
+            questions = []
+            while len(questions) < wanted:
+                ids = index.draw_many(category_id, seen, wanted - len(questions), weights)
+                if not ids:
+                    break
+                rows = {row.id: row for row in Question.rows().filter(Question.id.in_(ids)).all()}
+                for question_id in ids:
+                    seen.add(question_id)
+                    if question_id in rows:
+                        questions.append(Question.format_row(rows[question_id]))
+                    else:
+                        # deleted by another process since the index was loaded
+                        index.remove(question_id)
             if len(questions) == 0:
                 abort(404)
-            n = random.randint(0, len(questions) - 1)
-            print(f'rand: {n}, len of q: {len(questions)}')
-            question = questions[n].format()
-            print(question)
+            print(questions)
             ret = {
-                'success': True,
-                'question': question
+                'success': True
             }
+            if session is not None:
+                ret['session_id'] = session.id
+            else:
+                ret['seen_token'] = encode_seen(seen)
+            if count is None:
+                ret['question'] = questions[0]
+            else:
+                ret['questions'] = questions
             return jsonify(ret), 200
         except Exception as err:
             print(err)
             abort(err.code)
 
 
+    '''
+    Server-side grading: answers are compared after normalization (case,
+    accents, punctuation, articles) and small typos are accepted.
+    '''
+    @app.route('/quizzes/answer', methods=['POST'])
+    def check_answer():
+        data = request.get_json(silent=True) or {}
+        try:
+            question_id = int(data['question_id'])
+            answer = data['answer']
+        except (KeyError, TypeError, ValueError):
+            abort(400)
+        if not isinstance(answer, str):
+            abort(400)
+        session = None
+        if data.get('session_id'):
+            session = quiz_sessions.get(data['session_id'])
+            if session is None:
+                abort(404)
+        player = get_player(data, session.player if session is not None else None)
+        result = Question.grade(question_id, answer)
+        if result is None:
+            abort(404)
+        correct, expected = result
+        if session is not None:
+            # feeds 'adaptive' weighting for the next draws of the session
+            session.results.append(correct)
+        ret = {
+            'success': True,
+            'question_id': question_id,
+            'correct': correct,
+            'answer': expected
+        }
+        if player is not None:
+            ret['points'] = Score.record(player, question_id, correct)
+        return jsonify(ret), 200
+
+    '''
+    Leaderboard served from memory, scores are written to the database in batches.
+    '''
+    @app.route('/leaderboard')
+    def get_leaderboard():
+        limit = request.args.get('limit', 10, type=int)
+        if limit is None or limit <= 0:
+            abort(400)
+        board = Score.leaderboard()
+        ranking = []
+        rank = 0
+        previous = None
+        for i, (player, points) in enumerate(board.top(min(limit, MAX_LEADERBOARD)), 1):
+            if points != previous:
+                rank, previous = i, points
+            ranking.append({'rank': rank, 'player': player, 'points': points})
+        ret = {
+            'success': True,
+            'leaderboard': ranking,
+            'total_players': len(board)
+        }
+        player = request.args.get('player')
+        if player is not None:
+            position = board.rank(player)
+            if position is None:
+                abort(404)
+            ret['player'] = {'rank': position[0], 'player': player, 'points': position[1]}
+        return jsonify(ret), 200
+
+    '''
+    Server-side quiz sessions: the seen questions are kept in a bitmap keyed by
+    session_id, so `POST /quizzes` with a session_id needs no previous_questions.
+    '''
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        data = request.get_json(silent=True) or {}
+        category = data.get('quiz_category')
+        try:
+            category_id = quiz_category_id(category) if category is not None else None
+        except (KeyError, TypeError, ValueError):
+            abort(400)
+        session = quiz_sessions.create(category_id, get_weighting(data), get_player(data))
+        return jsonify({
+            'success': True,
+            'session_id': session.id,
+            'expires_in': quiz_sessions.ttl
+        }), 200
+
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def delete_quiz_session(session_id):
+        if not quiz_sessions.delete(session_id):
+            abort(404)
+        return jsonify({'success': True, 'deleted': session_id}), 200
+
     '''
     @TODO: 
     Create error handlers for all expected errors 
     including 404 and 422. 
     '''
+    @app.errorhandler(400)
+    def bad_request(err):
+        return jsonify({'success': False, 'message': 'bad request'}), 400
+
     @app.errorhandler(404)
     def not_found(err):
         return jsonify({'success': False, 'message': 'not found', 'data': [], 'total_questions': 0}), 404
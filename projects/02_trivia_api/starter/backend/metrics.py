@@ -0,0 +1,182 @@
+import bisect
+import threading
+import time
+
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+PREFIX = 'trivia_'
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ['{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"')) for n, v in zip(names, values)]
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+'''
+Counter / Histogram
+    minimal labelled Prometheus metrics, enough for the text exposition format
+'''
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * len(self.buckets), 0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *label_values):
+        state = self._values.get(label_values)
+        return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        labels = self.labels + ('le',)
+        for label_values, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                yield self.name + '_bucket', format_labels(labels, label_values + (format_value(float(bound)),)), cumulative
+            yield self.name + '_bucket', format_labels(labels, label_values + ('+Inf',)), n
+            yield self.name + '_sum', format_labels(self.labels, label_values), total
+            yield self.name + '_count', format_labels(self.labels, label_values), n
+
+
+'''
+Metrics
+    per-route latency, status codes and SQL statement counts/durations.
+    SQL is captured with SQLAlchemy cursor events, so it covers ORM and Core
+    queries alike. Values are per process.
+'''
+class Metrics:
+    def __init__(self):
+        self.request_latency = Histogram(
+            'http_request_duration_seconds', 'HTTP request latency by route.', ('method', 'route'))
+        self.requests = Counter(
+            'http_requests_total', 'HTTP responses by route and status code.', ('method', 'route', 'status'))
+        self.request_sql = Histogram(
+            'http_request_sql_statements', 'SQL statements issued per HTTP request.', ('method', 'route'),
+            buckets=COUNT_BUCKETS)
+        self.sql_statements = Counter(
+            'sql_statements_total', 'SQL statements executed by operation.', ('operation',))
+        self.sql_latency = Histogram(
+            'sql_statement_duration_seconds', 'SQL statement latency by operation.', ('operation',))
+        self.collectors = [self.request_latency, self.requests, self.request_sql, self.sql_statements, self.sql_latency]
+        self.gauges = []
+        self._watching = False
+
+    def add_gauge(self, name, help, kind, read):
+        '''
+        add_gauge(name, help, kind, read)
+            exposes a value read at scrape time, e.g. cache counters kept elsewhere
+        '''
+        self.gauges.append((PREFIX + name, help, kind, read))
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.render_response)
+        self.watch_engines()
+
+    def watch_engines(self):
+        # listen on the Engine class: setup_db() may replace the app's engine
+        if self._watching:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._watching = True
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql = 0
+
+    def _after_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        self.request_latency.observe(time.perf_counter() - start, request.method, route)
+        self.requests.inc(request.method, route, str(response.status_code))
+        self.request_sql.observe(g.pop('metrics_sql', 0), request.method, route)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('metrics_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+        self.sql_statements.inc(operation)
+        self.sql_latency.observe(elapsed, operation)
+        if has_request_context() and 'metrics_sql' in g:
+            g.metrics_sql += 1
+
+    def render(self):
+        lines = []
+        for collector in self.collectors:
+            lines.append('# HELP {} {}'.format(collector.name, collector.help))
+            lines.append('# TYPE {} {}'.format(collector.name, collector.kind))
+            for name, labels, value in collector.samples():
+                lines.append('{}{} {}'.format(name, labels, format_value(value)))
+        for name, help, kind, read in self.gauges:
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            lines.append('{} {}'.format(name, format_value(read())))
+        return '\n'.join(lines) + '\n'
+
+    def render_response(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
@@ -0,0 +1,35 @@
+--
+-- 001: questions.category as a typed integer foreign key to categories.id,
+-- with a composite (category, id) index so category-filtered pages and quiz
+-- draws become index range scans.
+--
+-- Safe to run more than once:
+--   psql trivia < migrations/001_questions_category_fk.sql
+--
+
+BEGIN;
+
+-- databases created by db.create_all() from the old model have a varchar column
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+        ALTER TABLE public.questions
+            ALTER COLUMN category TYPE integer USING NULLIF(trim(category), '')::integer;
+    END IF;
+END $$;
+
+-- trivia.psql names the constraint "category"
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.table_constraints
+                   WHERE table_name = 'questions' AND constraint_type = 'FOREIGN KEY') THEN
+        ALTER TABLE ONLY public.questions
+            ADD CONSTRAINT category FOREIGN KEY (category) REFERENCES public.categories(id)
+            ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category_id ON public.questions USING btree (category, id);
+
+COMMIT;
@@ -1,24 +1,182 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import atexit
+from contextlib import contextmanager
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Index, create_engine, func, literal_column
+from sqlalchemy import exc, orm
+from sqlalchemy.orm.attributes import set_committed_value
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from answers import AnswerIndex
+from pool import pool_options
+from quiz import QuizIndex
+from replicas import ReplicaSet
+from scores import ScoreBuffer, Leaderboard
+from search import SearchIndex, to_tsquery_text
 
 # database_name = "trivia"
 # database_path = "postgresql://{}/{}".format('postgres:admin@localhost:5432', database_name)
 
-db = SQLAlchemy()
+replicas = ReplicaSet(
+  cooldown=float(os.getenv('REPLICA_COOLDOWN', 30)),
+  lag=float(os.getenv('REPLICA_LAG', 2)))
+
+'''
+RoutingSession
+    sends the queries of a replicas.reading() block to a replica, as long as
+    the session has no pending writes; everything else goes to the primary
+'''
+class RoutingSession(SignallingSession):
+  def get_bind(self, mapper=None, clause=None):
+    if not self._flushing and not (self.new or self.deleted or self.dirty):
+      engine = replicas.engine_for_read()
+      if engine is not None:
+        return engine
+    return SignallingSession.get_bind(self, mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
 
+db = RoutingSQLAlchemy()
+
+# question ids per category for quiz draws, reloaded every 5 minutes so
+# writes from other worker processes are picked up
+quiz_index = QuizIndex(max_age=300)
+# full-text fallback for databases without tsvector support (SQLite)
+search_index = SearchIndex(max_age=300)
+# normalized answers for server-side grading
+answer_index = AnswerIndex(max_age=300)
+
+'''
+on_primary(loader)
+  `loader` run on the primary, for the process-wide indexes and caches
 '''
-setup_db(app)
-    binds a flask application and a SQLAlchemy service
+def on_primary(loader):
+  def load(*args):
+    with replicas.primary():
+      return loader(*args)
+  return load
+
+SEARCH_CONFIG = 'english'
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+
 '''
-def setup_db(app, database_path):
+setup_db(app, database_path, replica_paths)
+    binds a flask application and a SQLAlchemy service.
+    `replica_paths` are optional read replica URLs, bound as replica_0, replica_1, ...
+    Only routes wrapped in replicas.reading() use them.
+    Pool size, overflow, timeout, recycle and pre-ping come from the DB_POOL_*
+    settings (see pool.pool_options), explicit SQLALCHEMY_ENGINE_OPTIONS win.
+'''
+def setup_db(app, database_path, replica_paths=()):
   print(database_path)
   app.config["SQLALCHEMY_DATABASE_URI"] = database_path
   app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+  options = pool_options(app.config, database_path)
+  options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+  app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+  binds = {key: path for key, path in (app.config.get("SQLALCHEMY_BINDS") or {}).items()
+           if not key.startswith('replica_')}
+  replica_keys = []
+  for i, path in enumerate(replica_paths):
+    replica_keys.append('replica_{}'.format(i))
+    binds[replica_keys[-1]] = path
+  app.config["SQLALCHEMY_BINDS"] = binds
   db.app = app
   db.init_app(app)
-  db.create_all()
+  # schema changes only go to the primary, replicas follow it
+  db.create_all(bind=None)
+  create_search_index()
+  replicas.configure([db.get_engine(app, bind=key) for key in replica_keys])
+
+'''
+create_search_index()
+    creates the GIN index backing full-text question search on PostgreSQL
+'''
+def create_search_index():
+  if db.engine.dialect.name != 'postgresql':
+    return
+  db.session.execute(
+    "CREATE INDEX IF NOT EXISTS ix_questions_question_tsv ON questions "
+    "USING gin (to_tsvector('{}', coalesce(question, '')))".format(SEARCH_CONFIG))
+  db.session.commit()
+
+'''
+index_question(question) / unindex_question(question_id)
+    keep the in-memory quiz, search and answer indexes in sync after a commit,
+    `question` is the format() dict read before the commit expired the row
+'''
+def index_question(question):
+  quiz_index.add(question['id'], question['category'], question['difficulty'])
+  search_index.add(question['id'], question['question'])
+  answer_index.add(question['id'], question['answer'])
+  versions.bump('questions')
+
+def unindex_question(question_id):
+  quiz_index.remove(question_id)
+  search_index.remove(question_id)
+  answer_index.remove(question_id)
+  versions.bump('questions')
+
+_unit_of_work = threading.local()
+
+'''
+unit_of_work()
+    batches model writes: inside the block insert()/update()/delete() only stage
+    their changes, which are flushed and committed as one transaction when the
+    block exits (rolled back if it raises). Index and cache updates run once the
+    commit succeeded. Nested blocks join the outer one. Outside a block every
+    call still commits on its own.
+    EXAMPLE
+        with unit_of_work():
+            for question in questions:
+                question.delete()
+'''
+@contextmanager
+def unit_of_work():
+  if getattr(_unit_of_work, 'questions', None) is not None:
+    yield
+    return
+  _unit_of_work.questions = []
+  _unit_of_work.callbacks = []
+  try:
+    yield
+    db.session.flush()
+    # ids are set by the flush; read the rows before commit() expires them
+    staged = _unit_of_work.questions
+    changes = [(q.id, None if deleted else q.format()) for q, deleted in staged]
+    callbacks = _unit_of_work.callbacks
+    db.session.commit()
+    # put the committed values back so reading them does not reload every row
+    for (q, deleted), (question_id, question) in zip(staged, changes):
+      if question is not None:
+        for key, value in question.items():
+          set_committed_value(q, key, value)
+  except Exception:
+    db.session.rollback()
+    raise
+  finally:
+    _unit_of_work.questions = None
+    _unit_of_work.callbacks = None
+  for question_id, question in changes:
+    if question is None:
+      unindex_question(question_id)
+    else:
+      index_question(question)
+  for callback in dict.fromkeys(callbacks):
+    callback()
+
+def stage(question=None, deleted=False, callback=None):
+  with unit_of_work():
+    if question is not None:
+      _unit_of_work.questions.append((question, deleted))
+    if callback is not None:
+      _unit_of_work.callbacks.append(callback)
 
 '''
 Question
@@ -26,11 +184,13 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  # category pages and quiz draws filter on category and order by id
+  __table_args__ = (Index('ix_questions_category_id', 'category', 'id'),)
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -41,14 +201,96 @@ class Question(db.Model):
 
   def insert(self):
     db.session.add(self)
-    db.session.commit()
+    stage(self)
   
   def update(self):
-    db.session.commit()
+    stage(self)
 
   def delete(self):
     db.session.delete(self)
-    db.session.commit()
+    stage(self, deleted=True)
+
+  @staticmethod
+  def load_quiz_index():
+    quiz_index.ensure_loaded(on_primary(lambda: db.session.query(Question.id, Question.category, Question.difficulty).all()))
+    return quiz_index
+
+  '''
+  count(category)
+    total questions, or questions in `category`, read from the counters that
+    quiz_index keeps up to date on insert/update/delete instead of a COUNT(*)
+  '''
+  @staticmethod
+  def count(category=None):
+    return Question.load_quiz_index().count(category)
+
+  '''
+  search(term, offset, limit)
+    ranked full-text search over question text, returns (question rows, total).
+    PostgreSQL ranks the GIN-indexed tsvector and counts the hits with a window
+    function in the same query; a page past the last hit has no row to carry
+    the count, so it is counted separately. Other databases use the
+    in-process search_index and load only the rows of the requested page.
+  '''
+  @staticmethod
+  def search(term, offset=0, limit=10):
+    if db.engine.dialect.name == 'postgresql':
+      config = literal_column("'{}'".format(SEARCH_CONFIG))
+      tsquery_text = to_tsquery_text(term)
+      # rows carry an extra `total` column, format_row() only reads QUESTION_FIELDS
+      q = Question.rows().add_columns(func.count().over().label('total'))
+      if tsquery_text is None:
+        q = q.order_by(Question.id)
+      else:
+        document = func.to_tsvector(config, func.coalesce(Question.question, literal_column("''")))
+        tsquery = func.to_tsquery(config, tsquery_text)
+        q = q.filter(document.op('@@')(tsquery)).order_by(func.ts_rank(document, tsquery).desc(), Question.id)
+      rows = q.offset(offset).limit(limit).all()
+      if rows:
+        return rows, rows[0].total
+      if offset > 0:
+        return rows, q.order_by(None).with_entities(func.count(Question.id)).scalar()
+      return rows, 0
+
+    search_index.ensure_loaded(on_primary(lambda: db.session.query(Question.id, Question.question).all()))
+    ids, total = search_index.search(term, offset, limit)
+    if not ids:
+      return [], total
+    by_id = {row.id: row for row in Question.rows().filter(Question.id.in_(ids)).all()}
+    return [by_id[i] for i in ids if i in by_id], total
+
+  '''
+  grade(question_id, answer)
+    (correct, expected answer) for a player's answer, or None if the question
+    does not exist. Answers are normalized once when indexed; a question written
+    by another process since the last reload is fetched and indexed on demand.
+  '''
+  @staticmethod
+  def grade(question_id, answer):
+    answer_index.ensure_loaded(on_primary(lambda: db.session.query(Question.id, Question.answer).all()))
+    result = answer_index.grade(question_id, answer)
+    if result is None:
+      with replicas.primary():
+        row = db.session.query(Question.answer).filter(Question.id == question_id).first()
+      if row is None:
+        return None
+      answer_index.add(question_id, row.answer)
+      result = answer_index.grade(question_id, answer)
+    return result
+
+  '''
+  rows() / format_row(row)
+    read path for list endpoints: selects only the question columns as plain
+    tuples, skipping ORM hydration and the identity map. format_row(row) builds
+    the same dict as format(), so responses are byte-identical.
+  '''
+  @staticmethod
+  def rows():
+    return db.session.query(*[getattr(Question, field) for field in QUESTION_FIELDS])
+
+  @staticmethod
+  def format_row(row):
+    return dict(zip(QUESTION_FIELDS, row))
 
   def format(self):
     return {
@@ -72,8 +314,208 @@ class Category(db.Model):
   def __init__(self, type):
     self.type = type
 
+  def insert(self):
+    db.session.add(self)
+    stage(callback=categories_changed)
+
+  def update(self):
+    stage(callback=categories_changed)
+
+  def delete(self):
+    db.session.delete(self)
+    stage(callback=category_deleted)
+
   def format(self):
     return {
       'id': self.id,
       'type': self.type
     }
+
+'''
+Score
+    one row per graded answer, `points` is the question difficulty when correct.
+    Rows are written behind: record() buffers them in score_buffer, which inserts
+    them in batched transactions, and updates the in-memory leaderboard, so
+    answering never waits on the database.
+'''
+class Score(db.Model):
+  __tablename__ = 'scores'
+  __table_args__ = (Index('ix_scores_player', 'player'),)
+
+  id = Column(Integer, primary_key=True)
+  player = Column(String(80), nullable=False)
+  question_id = Column(Integer, ForeignKey('questions.id', ondelete='SET NULL'))
+  correct = Column(Boolean, nullable=False)
+  points = Column(Integer, nullable=False, default=0)
+  created_at = Column(DateTime, default=datetime.utcnow)
+
+  @staticmethod
+  def record(player, question_id, correct):
+    points = Question.load_quiz_index().difficulty(question_id) if correct else 0
+    entry = {'player': player, 'question_id': question_id, 'correct': correct,
+             'points': points, 'created_at': datetime.utcnow()}
+    with leaderboard.lock:
+      score_buffer.add(entry)
+      leaderboard.add(player, points)
+    return points
+
+  '''
+  leaderboard()
+    the loaded leaderboard. Loading flushes the buffer first and sums the points
+    per player in a single GROUP BY query; after that it is updated in memory.
+  '''
+  @staticmethod
+  def leaderboard():
+    leaderboard.ensure_loaded(Score.totals)
+    return leaderboard
+
+  @staticmethod
+  def totals():
+    score_buffer.flush()
+    return db.session.query(Score.player, func.sum(Score.points)).group_by(Score.player).all()
+
+def insert_scores(entries):
+  try:
+    db.session.execute(Score.__table__.insert(), entries)
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    raise
+
+'''
+write_scores(entries)
+  inserts buffered score rows. A question deleted after it was graded fails the
+  foreign key; those rows are kept with question_id NULL, as ON DELETE SET NULL
+  would have left them.
+'''
+def write_scores(entries):
+  try:
+    insert_scores(entries)
+  except exc.IntegrityError:
+    ids = {entry['question_id'] for entry in entries if entry['question_id'] is not None}
+    known = {question_id for (question_id,) in db.session.query(Question.id).filter(Question.id.in_(ids))}
+    if ids <= known:
+      raise
+    insert_scores([dict(entry, question_id=None) if entry['question_id'] not in known else entry
+                   for entry in entries])
+
+score_buffer = ScoreBuffer(
+  write_scores,
+  max_size=int(os.getenv('SCORE_FLUSH_SIZE', 500)),
+  interval=float(os.getenv('SCORE_FLUSH_INTERVAL', 2)),
+  # the rows themselves are bad: written one by one, the bad ones dropped
+  rejects=(exc.IntegrityError, exc.DataError))
+atexit.register(score_buffer.close)
+# per process: other workers' scores show up after LEADERBOARD_TTL seconds
+leaderboard = Leaderboard(max_age=float(os.environ['LEADERBOARD_TTL']) if os.getenv('LEADERBOARD_TTL') else None)
+
+def categories_changed():
+  category_cache.invalidate()
+  versions.bump('categories')
+
+def category_deleted():
+  categories_changed()
+  # the foreign key sets category to NULL on the questions of this category
+  quiz_index.invalidate()
+  versions.bump('questions')
+
+'''
+CategoryCache
+    process-local cache of the formatted category list.
+    Categories almost never change, so endpoints read them from here instead of
+    querying on every request. Category.insert/update/delete invalidate it and an
+    optional ttl (seconds) bounds staleness when another process writes.
+'''
+class CategoryCache:
+  def __init__(self, ttl=None):
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    self._categories = None
+    self._loaded_at = None
+
+  def _fresh(self):
+    if self._categories is None:
+      return False
+    return self.ttl is None or time.monotonic() - self._loaded_at <= self.ttl
+
+  def all(self):
+    with self._lock:
+      if self._fresh():
+        self.hits += 1
+        return self._categories
+      self.misses += 1
+      with replicas.primary():
+        self._categories = [c.format() for c in Category.query.order_by(Category.id).all()]
+      self._loaded_at = time.monotonic()
+      return self._categories
+
+  def as_dict(self):
+    return {c['id']: c['type'] for c in self.all()}
+
+  def invalidate(self):
+    with self._lock:
+      self._categories = None
+
+  def stats(self):
+    return {'hits': self.hits, 'misses': self.misses}
+
+category_cache = CategoryCache(ttl=float(os.environ['CATEGORY_CACHE_TTL']) if os.getenv('CATEGORY_CACHE_TTL') else None)
+
+'''
+ResourceVersions
+    write counters per resource ('questions', 'categories') used as cheap
+    ETag / Last-Modified validators, so conditional GETs can be answered
+    without touching the database. Model write helpers bump them.
+    Counters are per process, so validators also roll over every ttl
+    seconds (ETAG_TTL, 30 by default, 0 disables it): a worker that did not
+    see a write answers 304 for at most ttl seconds.
+'''
+class ResourceVersions:
+  def __init__(self, ttl=None):
+    self.ttl = ttl
+    self.boot_id = uuid.uuid4().hex[:8]
+    self._lock = threading.Lock()
+    self._counters = {}
+    self._modified = {}
+    self._written = {}
+    self._started = datetime.utcnow().replace(microsecond=0)
+
+  def bump(self, resource):
+    with self._lock:
+      self._counters[resource] = self._counters.get(resource, 0) + 1
+      self._modified[resource] = datetime.utcnow().replace(microsecond=0)
+      self._written[resource] = time.monotonic()
+
+  def written_within(self, seconds, *resources):
+    '''
+    written_within(seconds, *resources)
+      True if any of `resources` was written in this process in the last `seconds`
+    '''
+    now = time.monotonic()
+    return any(now - self._written.get(r, float('-inf')) < seconds for r in resources)
+
+  def version(self, resource):
+    '''
+    version(resource)
+      write counter of `resource` in this process; unlike etag() it only
+      changes on a write
+    '''
+    return self._counters.get(resource, 0)
+
+  def etag(self, *resources):
+    parts = [self.boot_id] + ['{}{}'.format(r[0], self._counters.get(r, 0)) for r in resources]
+    if self.ttl:
+      parts.append(str(int(time.time() // self.ttl)))
+    return '-'.join(parts)
+
+  def last_modified(self, *resources):
+    modified = [self._modified.get(r, self._started) for r in resources]
+    if self.ttl:
+      # start of the current ttl window, so If-Modified-Since rolls over too
+      modified.append(datetime.utcfromtimestamp(time.time() // self.ttl * self.ttl).replace(microsecond=0))
+    return max(modified)
+
+ETAG_TTL = 30
+versions = ResourceVersions(ttl=float(os.getenv('ETAG_TTL') or ETAG_TTL))
@@ -0,0 +1,426 @@
+import base64
+import binascii
+import random
+import secrets
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque
+
+from reloadable import Reloadable
+
+DIFFICULTY_LEVELS = (1, 2, 3, 4, 5)
+DEFAULT_DIFFICULTY = 3
+WEIGHTINGS = ('uniform', 'easy', 'hard', 'adaptive')
+ADAPTIVE_WINDOW = 10
+# seen ids a quiz token or previous_questions list may carry, and the
+# decompressed size of a token holding that many ids (at most 5 bytes each)
+MAX_SEEN_IDS = 100000
+MAX_SEEN_BYTES = MAX_SEEN_IDS * 5
+
+
+def category_key(category):
+    '''
+    category_key(category)
+        normalizes a question category ('4', 4, None) into the int key used by the indexes
+    '''
+    if category is None or category == '':
+        return None
+    return int(category)
+
+
+def difficulty_key(difficulty):
+    '''
+    difficulty_key(difficulty)
+        clamps a question difficulty into DIFFICULTY_LEVELS, missing values count as DEFAULT_DIFFICULTY
+    '''
+    if difficulty is None or difficulty == '':
+        return DEFAULT_DIFFICULTY
+    return min(max(int(difficulty), DIFFICULTY_LEVELS[0]), DIFFICULTY_LEVELS[-1])
+
+
+def difficulty_weights(mode='uniform', results=()):
+    '''
+    difficulty_weights(mode, results)
+        {difficulty: weight} for a weighting mode, or None for uniform draws.
+        'adaptive' aims at the difficulty matching the share of correct answers
+        among the last ADAPTIVE_WINDOW `results` (booleans), and halves the
+        weight for every level away from it.
+    '''
+    if mode == 'uniform':
+        return None
+    if mode == 'easy':
+        return {d: float(DIFFICULTY_LEVELS[-1] + 1 - d) for d in DIFFICULTY_LEVELS}
+    if mode == 'hard':
+        return {d: float(d) for d in DIFFICULTY_LEVELS}
+    if mode == 'adaptive':
+        recent = list(results)[-ADAPTIVE_WINDOW:]
+        skill = sum(1 for r in recent if r) / len(recent) if recent else 0.5
+        target = DIFFICULTY_LEVELS[0] + skill * (DIFFICULTY_LEVELS[-1] - DIFFICULTY_LEVELS[0])
+        return {d: 2.0 ** -abs(d - target) for d in DIFFICULTY_LEVELS}
+    raise ValueError('unknown weighting {!r}'.format(mode))
+
+
+'''
+AliasTable
+    Vose's alias method: O(n) to build, O(1) per weighted sample
+'''
+class AliasTable:
+    def __init__(self, items, weights):
+        self.items = list(items)
+        n = len(self.items)
+        total = float(sum(weights))
+        self._prob = [w * n / total for w in weights]
+        self._alias = list(range(n))
+        small = [i for i, p in enumerate(self._prob) if p < 1.0]
+        large = [i for i, p in enumerate(self._prob) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self._alias[s] = l
+            self._prob[l] -= 1.0 - self._prob[s]
+            (small if self._prob[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self._prob[i] = 1.0
+
+    def sample(self):
+        i = random.randrange(len(self.items))
+        return self.items[i] if random.random() < self._prob[i] else self.items[self._alias[i]]
+
+
+def encode_seen(ids):
+    '''
+    encode_seen(ids)
+        compact token for a set of seen question ids: sorted ids as delta varints,
+        deflated and base64url encoded. A 20-question quiz fits in a few dozen bytes.
+    '''
+    out = bytearray()
+    previous = 0
+    for question_id in sorted(set(ids)):
+        delta = question_id - previous
+        previous = question_id
+        while delta >= 0x80:
+            out.append((delta & 0x7f) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return base64.urlsafe_b64encode(zlib.compress(bytes(out))).decode().rstrip('=')
+
+
+def decode_seen(token):
+    '''
+    decode_seen(token)
+        inverse of encode_seen(); raises ValueError on a malformed token or one
+        holding more than MAX_SEEN_IDS ids. Decompression stops at MAX_SEEN_BYTES,
+        so a small token cannot expand into millions of ids.
+    '''
+    if not token:
+        return set()
+    try:
+        inflate = zlib.decompressobj()
+        data = inflate.decompress(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)), MAX_SEEN_BYTES)
+    except (binascii.Error, zlib.error) as e:
+        raise ValueError(e)
+    if inflate.unconsumed_tail:
+        raise ValueError('token too large')
+    ids = set()
+    current = shift = delta = 0
+    for byte in data:
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        current += delta
+        ids.add(current)
+        delta = shift = 0
+        if len(ids) > MAX_SEEN_IDS:
+            raise ValueError('token too large')
+    if shift:
+        raise ValueError('truncated token')
+    return ids
+
+
+'''
+QuizIndex
+    in-memory index of question ids per category used to draw quiz questions.
+    ids live in compact arrays; a position map makes insert and delete O(1)
+    (swap with the last slot and pop), and a draw is a random slot pick that
+    skips ids the player has already seen.
+    The key `None` holds every question ("All" in the Play tab).
+    Each category is also split into one array per difficulty level, keyed
+    (category, difficulty). A weighted draw picks a level from a per-category
+    alias table (weight x questions at that level), then a uniform slot in the
+    level's array, so it stays O(1). Inserts and deletes only drop the alias
+    tables of the touched categories, they are rebuilt from the level counts
+    (len(DIFFICULTY_LEVELS) entries) on the next weighted draw.
+'''
+class QuizIndex(Reloadable):
+    def __init__(self, max_age=None, max_tries=16):
+        Reloadable.__init__(self, max_age)
+        self.max_tries = max_tries
+        self._reset()
+
+    def _reset(self):
+        self._ids = {None: array('q')}
+        self._pos = {None: {}}
+        self._category = {}
+        self._alias = {}
+
+    def load(self, rows):
+        '''
+        load(rows)
+            rebuilds the index from (id, category, difficulty) rows
+        '''
+        with self._lock:
+            self._reset()
+            for question_id, category, difficulty in rows:
+                self._add(question_id, category, difficulty)
+            self._loaded_at = time.monotonic()
+
+    def add(self, question_id, category, difficulty=None):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._remove(question_id)
+            self._add(question_id, category, difficulty)
+
+    def remove(self, question_id):
+        with self._lock:
+            self._remove(question_id)
+
+    @staticmethod
+    def _keys(key, level):
+        if key is None:
+            return (None, (None, level))
+        return (None, (None, level), key, (key, level))
+
+    def _add(self, question_id, category, difficulty=None):
+        key = category_key(category)
+        level = difficulty_key(difficulty)
+        self._category[question_id] = (key, level)
+        self._alias.pop(None, None)
+        self._alias.pop(key, None)
+        for k in self._keys(key, level):
+            ids = self._ids.setdefault(k, array('q'))
+            self._pos.setdefault(k, {})[question_id] = len(ids)
+            ids.append(question_id)
+
+    def _remove(self, question_id):
+        if question_id not in self._category:
+            return
+        key, level = self._category.pop(question_id)
+        self._alias.pop(None, None)
+        self._alias.pop(key, None)
+        for k in self._keys(key, level):
+            ids = self._ids[k]
+            pos = self._pos[k]
+            i = pos.pop(question_id)
+            last = ids.pop()
+            if last != question_id:
+                ids[i] = last
+                pos[last] = i
+
+    def count(self, category=None):
+        '''
+        count(category)
+            number of indexed questions in `category` (None for all), maintained on every add/remove
+        '''
+        try:
+            ids = self._ids.get(category_key(category))
+        except ValueError:
+            return 0
+        return len(ids) if ids is not None else 0
+
+    def difficulty(self, question_id):
+        '''
+        difficulty(question_id)
+            difficulty level of an indexed question, DEFAULT_DIFFICULTY if unknown
+        '''
+        entry = self._category.get(question_id)
+        return entry[1] if entry is not None else DEFAULT_DIFFICULTY
+
+    def draw(self, category=None, seen=(), weights=None):
+        '''
+        draw(category, seen, weights)
+            returns a random question id of `category` (None for all) that is not in `seen`,
+            or None when every question of the category has been seen
+        '''
+        ids = self.draw_many(category, seen, 1, weights)
+        return ids[0] if ids else None
+
+    def _alias_table(self, key, weights):
+        # cached per category and weighting, dropped by _add/_remove
+        tables = self._alias.setdefault(key, {})
+        weights_key = tuple(sorted(weights.items()))
+        if weights_key not in tables:
+            levels = [d for d in DIFFICULTY_LEVELS if weights.get(d, 0) > 0 and self._ids.get((key, d))]
+            masses = [weights[d] * len(self._ids[(key, d)]) for d in levels]
+            tables[weights_key] = AliasTable(levels, masses) if levels else None
+        return tables[weights_key]
+
+    def draw_many(self, category=None, seen=(), count=1, weights=None):
+        '''
+        draw_many(category, seen, count, weights)
+            up to `count` distinct random question ids of `category` that are not in `seen`.
+            With `weights` ({difficulty: weight}, see difficulty_weights()) a question is
+            drawn with probability proportional to the weight of its difficulty.
+        '''
+        if isinstance(seen, (list, tuple)):
+            seen = set(seen)
+        if weights is not None:
+            return self._draw_weighted(category_key(category), seen, count, weights)
+        drawn = []
+        taken = set()
+        with self._lock:
+            ids = self._ids.get(category_key(category))
+            if not ids:
+                return drawn
+            n = len(ids)
+            for _ in range(self.max_tries * count):
+                question_id = ids[random.randrange(n)]
+                if question_id not in seen and question_id not in taken:
+                    drawn.append(question_id)
+                    taken.add(question_id)
+                    if len(drawn) == count:
+                        return drawn
+            # almost every id is seen: fall back to scanning the (in-memory) array
+            remaining = [i for i in ids if i not in seen and i not in taken]
+        drawn.extend(random.sample(remaining, min(count - len(drawn), len(remaining))))
+        return drawn
+
+    def _draw_weighted(self, key, seen, count, weights):
+        drawn = []
+        taken = set()
+        with self._lock:
+            table = self._alias_table(key, weights)
+            if table is None:
+                return drawn
+            for _ in range(self.max_tries * count):
+                ids = self._ids[(key, table.sample())]
+                question_id = ids[random.randrange(len(ids))]
+                if question_id not in seen and question_id not in taken:
+                    drawn.append(question_id)
+                    taken.add(question_id)
+                    if len(drawn) == count:
+                        return drawn
+            # same in-memory fallback as draw_many(), kept per level so the weights still apply
+            remaining = {d: [i for i in self._ids[(key, d)] if i not in seen and i not in taken]
+                         for d in table.items}
+        while len(drawn) < count:
+            levels = [d for d in remaining if remaining[d]]
+            if not levels:
+                break
+            level = random.choices(levels, [weights[d] * len(remaining[d]) for d in levels])[0]
+            ids = remaining[level]
+            i = random.randrange(len(ids))
+            ids[i], ids[-1] = ids[-1], ids[i]
+            drawn.append(ids.pop())
+        return drawn
+
+
+'''
+SeenBitmap
+    set of seen question ids stored as a chunked bitmap: one int bit mask per
+    block of CHUNK_BITS ids, so memory follows the touched part of the id space
+    rather than the largest id. Supports `in`, add() and len().
+'''
+class SeenBitmap:
+    CHUNK_BITS = 1024
+
+    def __init__(self, ids=()):
+        self._chunks = {}
+        self._count = 0
+        for question_id in ids:
+            self.add(question_id)
+
+    def add(self, question_id):
+        chunk, bit = divmod(question_id, self.CHUNK_BITS)
+        mask = self._chunks.get(chunk, 0)
+        if not mask >> bit & 1:
+            self._chunks[chunk] = mask | 1 << bit
+            self._count += 1
+
+    def update(self, ids):
+        for question_id in ids:
+            self.add(question_id)
+
+    def __contains__(self, question_id):
+        chunk, bit = divmod(question_id, self.CHUNK_BITS)
+        return bool(self._chunks.get(chunk, 0) >> bit & 1)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for chunk in sorted(self._chunks):
+            mask = self._chunks[chunk]
+            base = chunk * self.CHUNK_BITS
+            while mask:
+                low = mask & -mask
+                yield base + low.bit_length() - 1
+                mask ^= low
+
+
+class QuizSession:
+    def __init__(self, session_id, category, expires_at, weighting='uniform', player=None):
+        self.id = session_id
+        self.category = category
+        self.weighting = weighting
+        self.player = player
+        self.seen = SeenBitmap()
+        # recent correct/incorrect answers for 'adaptive' weighting
+        self.results = deque(maxlen=ADAPTIVE_WINDOW)
+        self.expires_at = expires_at
+
+
+'''
+QuizSessionStore
+    server-side quiz state keyed by an opaque session id. Sessions expire `ttl`
+    seconds after their last use, and at most `max_sessions` are kept: the least
+    recently used one is evicted first. State is per process.
+'''
+class QuizSessionStore:
+    def __init__(self, ttl=1800, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self, now):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.expires_at > now:
+                break
+            self._sessions.popitem(last=False)
+
+    def create(self, category=None, weighting='uniform', player=None):
+        now = time.monotonic()
+        session = QuizSession(secrets.token_urlsafe(16), category, now + self.ttl, weighting, player)
+        with self._lock:
+            self._expire(now)
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        '''
+        get(session_id)
+            returns the live session and extends its expiry, or None
+        '''
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.expires_at = now + self.ttl
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
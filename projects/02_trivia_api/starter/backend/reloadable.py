@@ -0,0 +1,35 @@
+import threading
+import time
+
+
+'''
+Reloadable
+    base of the in-process indexes built from a database query. load(rows)
+    rebuilds the index and stamps `_loaded_at`; the index counts as loaded
+    until `max_age` seconds have passed or invalidate() is called, and
+    ensure_loaded(loader) reloads it from loader() when it is not.
+'''
+class Reloadable:
+    def __init__(self, max_age=None, lock=None):
+        self.max_age = max_age
+        self._lock = lock if lock is not None else threading.Lock()
+        self._loaded_at = None
+
+    @property
+    def loaded(self):
+        if self._loaded_at is None:
+            return False
+        if self.max_age is not None and time.monotonic() - self._loaded_at > self.max_age:
+            return False
+        return True
+
+    def load(self, rows):
+        raise NotImplementedError
+
+    def ensure_loaded(self, loader):
+        if not self.loaded:
+            self.load(loader())
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
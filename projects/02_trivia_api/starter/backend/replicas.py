@@ -0,0 +1,111 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event, exc
+
+
+'''
+ReplicaSet
+    read replicas for the read-only routes. Inside reading() the session asks
+    engine_for_read() for an engine: replicas are picked round robin, one per
+    request, skipping any replica that failed within the last `cooldown`
+    seconds. A connection error or disconnect on a replica marks it down and
+    flags the request, so the caller can rerun it on the primary.
+    Outside reading(), or with no healthy replica, everything uses the primary.
+'''
+class ReplicaSet:
+    def __init__(self, cooldown=30, lag=2):
+        self.cooldown = cooldown
+        # seconds a client keeps reading from the primary after a write
+        self.lag = lag
+        self.reads = 0
+        self.failovers = 0
+        self._engines = []
+        self._down_until = {}
+        self._counter = itertools.count()
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self._engines)
+
+    def configure(self, engines):
+        for engine in engines:
+            if not event.contains(engine, 'handle_error', self._on_error):
+                event.listen(engine, 'handle_error', self._on_error)
+        self._engines = list(engines)
+        self._down_until = {}
+
+    def healthy(self):
+        now = time.monotonic()
+        return sum(1 for engine in self._engines if self._down_until.get(engine, 0) <= now)
+
+    @contextmanager
+    def reading(self):
+        state = self._local
+        state.reading = True
+        state.engine = None
+        state.failed = False
+        try:
+            yield
+        finally:
+            state.reading = False
+            state.engine = None
+
+    @contextmanager
+    def primary(self):
+        '''
+        primary()
+            sends the queries of the block to the primary, even inside reading().
+            Process-wide caches are filled this way: they outlive the request and
+            must not keep what a lagging replica returned.
+        '''
+        state = self._local
+        reading = getattr(state, 'reading', False)
+        state.reading = False
+        try:
+            yield
+        finally:
+            state.reading = reading
+
+    def serving(self):
+        '''
+        serving()
+            True while the current reading() block reads from a replica
+        '''
+        state = self._local
+        return getattr(state, 'engine', None) is not None and not state.failed
+
+    def failed(self):
+        return getattr(self._local, 'failed', False)
+
+    def engine_for_read(self):
+        '''
+        engine_for_read()
+            the replica engine of the current reading() block, or None for the primary
+        '''
+        state = self._local
+        if not getattr(state, 'reading', False) or state.failed or not self._engines:
+            return None
+        if state.engine is not None:
+            return state.engine
+        now = time.monotonic()
+        start = next(self._counter)
+        for i in range(len(self._engines)):
+            engine = self._engines[(start + i) % len(self._engines)]
+            if self._down_until.get(engine, 0) <= now:
+                state.engine = engine
+                self.reads += 1
+                return engine
+        return None
+
+    def _on_error(self, context):
+        # connection is None when the connect itself failed
+        if not (context.is_disconnect or context.connection is None
+                or isinstance(context.sqlalchemy_exception, exc.OperationalError)):
+            return
+        self._down_until[context.engine] = time.monotonic() + self.cooldown
+        if getattr(self._local, 'engine', None) is context.engine:
+            self._local.failed = True
+            self.failovers += 1
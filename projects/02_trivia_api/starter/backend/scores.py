@@ -0,0 +1,182 @@
+import bisect
+import logging
+import threading
+import time
+
+from reloadable import Reloadable
+
+logger = logging.getLogger(__name__)
+
+
+'''
+ScoreBuffer
+    write-behind buffer for score rows. add() only appends to a list; a
+    background thread hands the pending rows to `writer` in one batch every
+    `interval` seconds, or as soon as `max_size` rows are waiting. A batch
+    that fails with one of the `rejects` exceptions (the rows themselves are
+    bad) is retried row by row and the rows that still fail are dropped; any
+    other failure is taken as transient and the rows are put back, keeping at
+    most `max_pending`. Without an interval, the batch is written by the add()
+    that fills it.
+'''
+class ScoreBuffer:
+    def __init__(self, writer, max_size=500, interval=2.0, max_pending=100000, rejects=()):
+        self.writer = writer
+        self.max_size = max_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.rejects = tuple(rejects)
+        self.flushed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failures = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, entry):
+        with self._lock:
+            self._pending.append(entry)
+            full = len(self._pending) >= self.max_size
+        if not self.interval:
+            if full:
+                self.flush()
+            return
+        self._start()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        '''
+        flush()
+            writes every pending row in one batch (row by row if the batch is
+            rejected), returns the number written
+        '''
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                self.writer(batch)
+            except self.rejects:
+                logger.warning('score batch of %d rows rejected, writing row by row', len(batch))
+                self.failures += 1
+            except Exception:
+                logger.exception('score batch of %d rows failed, kept for the next flush', len(batch))
+                self.failures += 1
+                self._requeue(batch)
+                return 0
+            else:
+                self.flushed += len(batch)
+                return len(batch)
+            return self._write_rows(batch)
+
+    def _write_rows(self, batch):
+        written = 0
+        for i, entry in enumerate(batch):
+            try:
+                self.writer([entry])
+            except self.rejects:
+                logger.warning('dropped score row %r', entry, exc_info=True)
+                self.rejected += 1
+                continue
+            except Exception:
+                logger.exception('score rows failed, kept for the next flush')
+                self._requeue(batch[i:])
+                break
+            written += 1
+        self.flushed += written
+        return written
+
+    def _requeue(self, rows):
+        with self._lock:
+            self._pending[:0] = rows
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='score-buffer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+
+'''
+Leaderboard
+    total points per player plus a ranking kept sorted as (-points, player),
+    so top(n) is a slice and rank() a bisect. `lock` is reentrant so callers
+    can update the leaderboard and the score buffer atomically.
+'''
+class Leaderboard(Reloadable):
+    def __init__(self, max_age=None):
+        Reloadable.__init__(self, max_age, threading.RLock())
+        self.lock = self._lock
+        self._scores = {}
+        self._ranking = []
+
+    def __len__(self):
+        return len(self._scores)
+
+    def load(self, rows):
+        '''
+        load(rows)
+            rebuilds the leaderboard from (player, total points) rows
+        '''
+        with self.lock:
+            self._scores = {player: int(points or 0) for player, points in rows}
+            self._ranking = sorted((-points, player) for player, points in self._scores.items())
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self, loader):
+        # the lock is held while loading so no add() lands in the old ranking
+        with self.lock:
+            Reloadable.ensure_loaded(self, loader)
+
+    def add(self, player, points):
+        with self.lock:
+            if self._loaded_at is None:
+                # counted by the next load()
+                return
+            old = self._scores.get(player)
+            if old is not None:
+                del self._ranking[bisect.bisect_left(self._ranking, (-old, player))]
+            score = (old or 0) + points
+            self._scores[player] = score
+            bisect.insort(self._ranking, (-score, player))
+
+    def top(self, n=10):
+        with self.lock:
+            return [(player, -points) for points, player in self._ranking[:n]]
+
+    def rank(self, player):
+        '''
+        rank(player)
+            (rank, points) of a player, players with the same points share a rank; None if unknown
+        '''
+        with self.lock:
+            score = self._scores.get(player)
+            if score is None:
+                return None
+            return bisect.bisect_left(self._ranking, (-score, '')) + 1, score
@@ -0,0 +1,129 @@
+import bisect
+import heapq
+import math
+import re
+import time
+
+from reloadable import Reloadable
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def to_tsquery_text(term):
+    '''
+    to_tsquery_text(term)
+        builds a safe to_tsquery() expression: every word must match and the
+        last one is a prefix, so results update while the user is typing
+    '''
+    tokens = tokenize(term)
+    if not tokens:
+        return None
+    return ' & '.join(tokens[:-1] + [tokens[-1] + ':*'])
+
+
+'''
+SearchIndex
+    in-process inverted index over question text, used when the database
+    has no full-text search (SQLite). Postings map token -> {question id: term frequency};
+    a sorted vocabulary gives prefix lookups for the last search word.
+    Results are ranked by tf-idf, ties broken by id.
+'''
+class SearchIndex(Reloadable):
+    def __init__(self, max_age=None):
+        Reloadable.__init__(self, max_age)
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}
+        self._vocabulary = []
+        self._docs = {}
+
+    def load(self, rows):
+        '''
+        load(rows)
+            rebuilds the index from (id, text) rows
+        '''
+        with self._lock:
+            self._reset()
+            for doc_id, text in rows:
+                self._add(doc_id, text)
+            self._loaded_at = time.monotonic()
+
+    def add(self, doc_id, text):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._remove(doc_id)
+            self._add(doc_id, text)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _add(self, doc_id, text):
+        tokens = tokenize(text)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        self._docs[doc_id] = tuple(counts)
+        for token, tf in counts.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[doc_id] = tf
+
+    def _remove(self, doc_id):
+        tokens = self._docs.pop(doc_id, None)
+        if tokens is None:
+            return
+        for token in tokens:
+            postings = self._postings[token]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[token]
+                i = bisect.bisect_left(self._vocabulary, token)
+                del self._vocabulary[i]
+
+    def _prefix_tokens(self, prefix):
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            yield self._vocabulary[i]
+            i += 1
+
+    def search(self, term, offset=0, limit=10):
+        '''
+        search(term, offset, limit)
+            returns (ids of the requested page in rank order, total number of hits).
+            An empty term matches every question, ordered by id.
+        '''
+        tokens = tokenize(term)
+        with self._lock:
+            n_docs = len(self._docs) or 1
+            if not tokens:
+                ids = sorted(self._docs)
+                return ids[offset:offset + limit], len(ids)
+
+            scores = None
+            for i, token in enumerate(tokens):
+                matched = [token] if i < len(tokens) - 1 else self._prefix_tokens(token)
+                token_scores = {}
+                for t in matched:
+                    postings = self._postings.get(t, {})
+                    idf = math.log(1 + n_docs / len(postings)) if postings else 0
+                    for doc_id, tf in postings.items():
+                        token_scores[doc_id] = token_scores.get(doc_id, 0) + tf * idf
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {doc_id: score + token_scores[doc_id]
+                              for doc_id, score in scores.items() if doc_id in token_scores}
+                if not scores:
+                    return [], 0
+
+        top = heapq.nsmallest(offset + limit, scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+        return top[offset:], len(scores)
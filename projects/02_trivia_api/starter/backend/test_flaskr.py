@@ -1,12 +1,18 @@
 import os
+import time
 import unittest
 import json
+import base64
+import zlib
 from unittest import TestCase
 
+from flask import jsonify
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from answers import AnswerIndex
+from scores import ScoreBuffer
+from models import setup_db, Question, Category, ResourceVersions, versions, category_cache, score_buffer, replicas
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -45,6 +51,37 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_count'])
         self.assertTrue(len(data))
 
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_etag_rolls_over_after_ttl(self):
+        resource_versions = ResourceVersions(ttl=0.05)
+        etag = resource_versions.etag('questions')
+        time.sleep(0.1)
+
+        self.assertTrue(versions.ttl)
+        self.assertNotEqual(resource_versions.etag('questions'), etag)
+
+    def test_get_questions_etag_changes_after_write(self):
+        etag = self.client().get('/questions').headers['ETag']
+        body = {'question': 'xxx', 'answer': 'yyy', 'category': 1, 'difficulty': 2}
+        self.client().post('/questions', json=body)
+        res = self.client().get('/questions', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_get_categories_is_cached(self):
+        self.client().get('/categories')
+        hits = category_cache.stats()['hits']
+        res = self.client().get('/categories')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(category_cache.stats()['hits'], hits + 1)
+
     # Questions
     def test_get_questions(self):
         res = self.client().get('/questions')
@@ -101,6 +138,36 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertTrue(len(data))
 
+    def test_format_row_matches_format(self):
+        with self.app.test_request_context():
+            formatted = [q.format() for q in Question.query.order_by(Question.id).all()]
+            rows = [Question.format_row(r) for r in Question.rows().order_by(Question.id).all()]
+            self.assertEqual(jsonify(formatted).data, jsonify(rows).data)
+
+    def test_get_questions_with_cursor(self):
+        res = self.client().get('/questions?per_page=2')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 2)
+        self.assertTrue(data['next_cursor'])
+
+        res = self.client().get('/questions?per_page=2&cursor={}'.format(data['next_cursor']))
+        next_data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(next_data['questions'][0]['id'], data['questions'][-1]['id'])
+
+    def test_get_questions_with_after_id(self):
+        res = self.client().get('/questions?after_id=5')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(all(q['id'] > 5 for q in data['questions']))
+
+    def test_get_questions_with_invalid_cursor(self):
+        res = self.client().get('/questions?cursor=%%%')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
     def test_delete_question(self):
         # Question for delete
         try:
@@ -128,6 +195,43 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertGreaterEqual(len(data), 0)
 
+    def test_post_and_delete_question_update_total(self):
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+        body = {'question': 'xxx', 'answer': 'yyy', 'category': 1, 'difficulty': 2}
+        data = json.loads(self.client().post('/questions', json=body).data)
+        self.assertEqual(data['total_questions'], total + 1)
+
+        data = json.loads(self.client().delete('/questions/{}'.format(data['id'])).data)
+        self.assertEqual(data['total_questions'], total)
+
+    def test_bulk_import_questions(self):
+        lines = [
+            json.dumps({'question': 'bulk q1', 'answer': 'a', 'category': 1, 'difficulty': 1}),
+            json.dumps({'question': 'bulk q2', 'answer': 'a', 'category': 2, 'difficulty': 2}),
+            '{not json',
+        ]
+        res = self.client().post('/questions/import', data='\n'.join(lines), content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported'], 2)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['errors'][0]['line'], 3)
+
+    def test_bulk_import_questions_with_invalid_format(self):
+        res = self.client().post('/questions/import?format=xml', data='')
+        self.assertEqual(res.status_code, 400)
+
+    def test_bulk_export_questions(self):
+        res = self.client().get('/questions/export')
+        lines = res.data.decode().splitlines()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertIn('question', json.loads(lines[0]))
+
+        res = self.client().get('/questions/export?format=csv')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.data.startswith(b'id,question,answer,category,difficulty'))
+
     def test_get_questions_by_search_term(self):
         res = self.client().get('/questions/search?t=Taj')
         data = json.loads(res.data)
@@ -136,6 +240,29 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertGreaterEqual(data['total_questions'], 0)
 
+    def test_get_questions_by_search_term_prefix(self):
+        res = self.client().get('/questions/search?t=socc')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertGreaterEqual(data['total_questions'], 2)
+
+    def test_get_questions_by_search_term_with_pagination(self):
+        res = self.client().get('/questions/search?t=the&per_page=2&page=1')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(len(data['questions']), 2)
+        self.assertGreaterEqual(data['total_questions'], len(data['questions']))
+
+    def test_search_page_past_last_hit_keeps_total(self):
+        total = json.loads(self.client().get('/questions/search?t=socc').data)['total_questions']
+        res = self.client().get('/questions/search?t=socc&per_page=2&page=50')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'], [])
+        self.assertEqual(data['total_questions'], total)
+        self.assertTrue(total)
+
     def test_get_questions_by_category(self):
         res = self.client().get('/categories/1/questions')
         data = json.loads(res.data)
@@ -144,6 +271,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertGreaterEqual(len(data), 0)
 
+    def test_get_questions_by_category_returns_integer_category(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(all(q['category'] == 1 for q in data['questions']))
+
+    def test_get_questions_by_invalid_category(self):
+        res = self.client().get('/categories/abc/questions')
+        self.assertEqual(res.status_code, 404)
+
     def test_quizzes(self):
         body = {
             'previous_questions': [],
@@ -156,6 +293,253 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertGreaterEqual(len(data['question']), 0)
 
+    def test_quizzes_skips_previous_questions(self):
+        body = {
+            'previous_questions': [5, 9, 12],
+            'quiz_category': {'id': 3, 'type': 'History'}
+        }
+        res = self.client().post('/quizzes', json=body)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn(data['question']['id'], body['previous_questions'])
+        self.assertEqual(int(data['question']['category']), 4)
+
+    def test_metrics(self):
+        self.client().get('/categories')
+        res = self.client().get('/metrics')
+        body = res.data.decode()
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('trivia_http_request_duration_seconds_count{method="GET",route="/categories"}', body)
+        self.assertIn('trivia_http_requests_total{method="GET",route="/categories",status="200"}', body)
+        self.assertIn('trivia_sql_statements_total{operation="SELECT"}', body)
+
+    def test_quizzes_batch_with_seen_token(self):
+        body = {'quiz_category': {'id': 0, 'type': 'click'}, 'count': 5}
+        res = self.client().post('/quizzes', json=body)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 5)
+        first = set(q['id'] for q in data['questions'])
+        self.assertEqual(len(first), 5)
+
+        body['seen_token'] = data['seen_token']
+        res = self.client().post('/quizzes', json=body)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(first & set(q['id'] for q in data['questions']))
+
+    def test_quizzes_with_invalid_seen_token(self):
+        body = {'quiz_category': {'id': 0, 'type': 'click'}, 'seen_token': '!!'}
+        res = self.client().post('/quizzes', json=body)
+        self.assertEqual(res.status_code, 400)
+
+    def test_quizzes_with_oversized_seen_token(self):
+        # a few KB that inflate to millions of ids
+        token = base64.urlsafe_b64encode(zlib.compress(b'\x01' * 5000000)).decode()
+        body = {'quiz_category': {'id': 0, 'type': 'click'}, 'seen_token': token}
+        res = self.client().post('/quizzes', json=body)
+        self.assertEqual(res.status_code, 400)
+
+    def test_quizzes_with_invalid_previous_questions(self):
+        for previous_questions in ([-5], ['x'], [True], 5):
+            body = {'quiz_category': {'id': 0, 'type': 'click'}, 'previous_questions': previous_questions}
+            res = self.client().post('/quizzes', json=body)
+            self.assertEqual(res.status_code, 400)
+
+    def test_quizzes_with_boolean_count(self):
+        body = {'quiz_category': {'id': 0, 'type': 'click'}, 'count': True}
+        res = self.client().post('/quizzes', json=body)
+        self.assertEqual(res.status_code, 400)
+
+    def test_quiz_session(self):
+        body = {'quiz_category': {'id': 3, 'type': 'History'}}
+        res = self.client().post('/quizzes/sessions', json=body)
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        session_id = data['session_id']
+
+        asked = set()
+        for _ in range(2):
+            res = self.client().post('/quizzes', json={'session_id': session_id})
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn(data['question']['id'], asked)
+            asked.add(data['question']['id'])
+
+        res = self.client().delete('/quizzes/sessions/{}'.format(session_id))
+        self.assertEqual(res.status_code, 200)
+        res = self.client().post('/quizzes', json={'session_id': session_id})
+        self.assertEqual(res.status_code, 404)
+
+    def test_quiz_weighted(self):
+        body = {'quiz_category': {'type': 'click', 'id': 0}, 'count': 5, 'weighting': 'adaptive',
+                'recent_results': [True, True, False]}
+        res = self.client().post('/quizzes', json=body)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 5)
+        self.assertEqual(len(set(q['id'] for q in data['questions'])), 5)
+
+    def test_400_quiz_unknown_weighting(self):
+        body = {'quiz_category': {'type': 'click', 'id': 0}, 'weighting': 'random'}
+        res = self.client().post('/quizzes', json=body)
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_quiz_answer(self):
+        question = Question.query.filter(Question.answer == 'Lake Victoria').first()
+        for answer, correct in (('lake victoria', True), ('The Lake Victria!', True), ('Lake Chad', False)):
+            res = self.client().post('/quizzes/answer', json={'question_id': question.id, 'answer': answer})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['correct'], correct)
+            self.assertEqual(data['answer'], 'Lake Victoria')
+
+    def test_quiz_answer_numbers_match_exactly(self):
+        question = Question.query.filter(Question.answer == 'Apollo 13').first()
+        for answer, correct in (('apollo 13', True), ('Apolo 13', True), ('Apollo 12', False), ('apollo 31', False)):
+            res = self.client().post('/quizzes/answer', json={'question_id': question.id, 'answer': answer})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['correct'], correct)
+
+    def test_answer_index_years(self):
+        index = AnswerIndex()
+        index.add(1, '1930')
+        index.add(2, 'Uruguay in 1930')
+
+        self.assertEqual(index.grade(1, '1930'), (True, '1930'))
+        self.assertEqual(index.grade(1, '1931'), (False, '1930'))
+        self.assertTrue(index.grade(2, 'uruguai in 1930')[0])
+        self.assertFalse(index.grade(2, 'uruguay in 1931')[0])
+
+    def test_404_quiz_answer_unknown_question(self):
+        res = self.client().post('/quizzes/answer', json={'question_id': 100000, 'answer': 'x'})
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_leaderboard(self):
+        question = Question.query.filter(Question.answer == 'Lake Victoria').first()
+        body = {'question_id': question.id, 'answer': 'Lake Victoria', 'player': 'test_leaderboard'}
+        res = self.client().post('/quizzes/answer', json=body)
+        data = json.loads(res.data)
+        self.assertEqual(data['points'], question.difficulty)
+
+        res = self.client().get('/leaderboard?player=test_leaderboard')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['leaderboard'])
+        self.assertGreaterEqual(data['player']['points'], question.difficulty)
+
+        score_buffer.flush()
+        self.assertEqual(len(score_buffer), 0)
+
+    def test_score_buffer_drops_bad_rows(self):
+        written = []
+
+        def writer(rows):
+            if any(row < 0 for row in rows):
+                raise ValueError('bad row')
+            written.extend(rows)
+
+        buffer = ScoreBuffer(writer, interval=None, rejects=(ValueError,))
+        for row in (1, -2, 3):
+            buffer.add(row)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(written, [1, 3])
+        self.assertEqual((len(buffer), buffer.rejected), (0, 1))
+
+    def test_score_buffer_keeps_rows_on_transient_failure(self):
+        def writer(rows):
+            raise ConnectionError('database is down')
+
+        buffer = ScoreBuffer(writer, interval=None, rejects=(ValueError,))
+        buffer.add(1)
+        buffer.add(2)
+
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual((len(buffer), buffer.rejected), (2, 0))
+
+    def test_404_leaderboard_unknown_player(self):
+        res = self.client().get('/leaderboard?player=nobody-has-this-name')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_bulk_delete_questions(self):
+        ids = []
+        for i in range(3):
+            q = Question(question='bulk delete {}'.format(i), answer='a', category=1, difficulty=2)
+            q.insert()
+            ids.append(q.id)
+
+        res = self.client().delete('/questions?ids={},100000'.format(','.join(str(i) for i in ids)))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], sorted(ids))
+        self.assertEqual(data['not_found'], [100000])
+        self.assertEqual(Question.query.filter(Question.id.in_(ids)).count(), 0)
+
+    def test_400_bulk_delete_without_ids(self):
+        res = self.client().delete('/questions')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_post_question_minimal(self):
+        body = {'question': 'lean?', 'answer': 'yes', 'category': 1, 'difficulty': 1}
+        res = self.client().post('/questions?return=minimal', json=body)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['answer'], 'yes')
+        self.assertNotIn('data', data)
+        self.assertTrue(data['version'])
+
+        res = self.client().delete('/questions/{}'.format(data['id']), headers={'Prefer': 'return=minimal'})
+        deleted = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(deleted['deleted'], data['id'])
+        self.assertNotIn('questions', deleted)
+        self.assertEqual(deleted['version'], data['version'] + 1)
+        self.assertEqual(res.headers['Preference-Applied'], 'return=minimal')
+
+    def test_read_replica(self):
+        # the test database doubles as its own replica
+        setup_db(self.app, self.database_path, [self.database_path])
+        try:
+            reads = replicas.reads
+            res = self.client().get('/questions')
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(replicas.reads, reads + 1)
+        finally:
+            setup_db(self.app, self.database_path)
+
+    def test_read_replica_loads_caches_from_primary(self):
+        setup_db(self.app, self.database_path, [self.database_path])
+        try:
+            reads = replicas.reads
+            category_cache.invalidate()
+            res = self.client().get('/categories')
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(replicas.reads, reads)
+        finally:
+            setup_db(self.app, self.database_path)
+
+    def test_pool_metrics(self):
+        self.client().get('/categories')
+        res = self.client().get('/metrics')
+        body = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('trivia_db_pool_checked_out ', body)
+        self.assertIn('trivia_db_pool_wait_seconds_total ', body)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -4,7 +4,8 @@ from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, db, Drink
+from .database.pool import pool_stats
 from .auth.auth import AuthError, requires_auth
 
 app = Flask(__name__)
@@ -19,6 +20,20 @@ CORS(app)
 # db_drop_and_create_all()
 
 ## ROUTES
+'''
+GET /pool-stats
+    requires the 'get:pool-stats' permission
+    live connection pool numbers (checked out, overflow, waits, timeouts)
+    for sizing the pool and the worker count
+'''
+@app.route('/pool-stats')
+@requires_auth('get:pool-stats')
+def get_pool_stats(payload):
+    return jsonify({
+        "success": True,
+        "pool": pool_stats(db.engine)
+    })
+
 '''
 @TODO implement endpoint
     GET /drinks
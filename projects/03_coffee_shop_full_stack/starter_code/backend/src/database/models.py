@@ -2,20 +2,29 @@ import os
 from sqlalchemy import Column, String, Integer
 from flask_sqlalchemy import SQLAlchemy
 import json
+import threading
+from contextlib import contextmanager
+
+from .pool import pool_options
 
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+database_path = os.getenv('DATABASE_URL') or "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
 db = SQLAlchemy()
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    pool settings come from DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE and DB_POOL_PRE_PING (app config or environment)
 '''
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    options = pool_options(app.config, database_path)
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
     db.app = app
     db.init_app(app)
 
@@ -29,6 +38,41 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+_unit_of_work = threading.local()
+
+'''
+unit_of_work()
+    batches model writes: insert()/update()/delete() calls inside the block
+    skip their own commit and the whole block is committed as one transaction
+    when it exits (rolled back if it raises). Nested blocks join the outer one.
+    EXAMPLE
+        with unit_of_work():
+            for drink in drinks:
+                drink.delete()
+'''
+@contextmanager
+def unit_of_work():
+    if getattr(_unit_of_work, 'active', False):
+        yield
+        return
+    _unit_of_work.active = True
+    try:
+        yield
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        _unit_of_work.active = False
+
+'''
+commit()
+    commits the session unless an enclosing unit_of_work() will
+'''
+def commit():
+    if not getattr(_unit_of_work, 'active', False):
+        db.session.commit()
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -77,7 +121,7 @@ class Drink(db.Model):
     '''
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
 
     '''
     delete()
@@ -89,7 +133,7 @@ class Drink(db.Model):
     '''
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        commit()
 
     '''
     update()
@@ -101,7 +145,7 @@ class Drink(db.Model):
             drink.update()
     '''
     def update(self):
-        db.session.commit()
+        commit()
 
     def __repr__(self):
         return json.dumps(self.short())
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+# (create_engine option, app config key / environment variable, type)
+POOL_SETTINGS = (
+    ('pool_size', 'DB_POOL_SIZE', int),
+    ('max_overflow', 'DB_MAX_OVERFLOW', int),
+    ('pool_timeout', 'DB_POOL_TIMEOUT', float),
+    ('pool_recycle', 'DB_POOL_RECYCLE', int),
+    ('pool_pre_ping', 'DB_POOL_PRE_PING', parse_bool),
+)
+# only meaningful for a queue pool; SQLite file databases are not pooled
+QUEUE_SETTINGS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+'''
+pool_options(config, path)
+    create_engine() pool options from the DB_POOL_* / DB_MAX_OVERFLOW keys of
+    the app config, falling back to environment variables. Unset keys keep
+    the SQLAlchemy defaults.
+'''
+def pool_options(config, path):
+    options = {}
+    for option, key, cast in POOL_SETTINGS:
+        value = config.get(key)
+        if value is None:
+            value = os.getenv(key)
+        if value is None or value == '':
+            continue
+        options[option] = cast(value)
+    if path.startswith('sqlite'):
+        for option in QUEUE_SETTINGS:
+            options.pop(option, None)
+    else:
+        options['poolclass'] = TimedQueuePool
+    return options
+
+'''
+TimedQueuePool
+    QueuePool that records checkouts, time spent waiting for a connection and
+    checkouts that gave up after pool_timeout
+'''
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        QueuePool.__init__(self, *args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return QueuePool._do_get(self)
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.timeouts += timed_out
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+'''
+pool_stats(engine)
+    live numbers of the engine's connection pool, used to size worker counts
+'''
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        stats[name] = getattr(pool, name)() if hasattr(pool, name) else 0
+    # QueuePool counts overflow from -size, only connections beyond size are overflow
+    stats['overflow'] = max(stats['overflow'], 0)
+    for name in ('checkouts', 'timeouts', 'wait_seconds', 'max_wait_seconds'):
+        stats[name] = getattr(pool, name, 0)
+    return stats